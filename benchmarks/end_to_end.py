@@ -0,0 +1,344 @@
+import argparse
+import functools
+import importlib
+import inspect
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from benchmarks.fakes import (
+    FakeMarket,
+    FakeServer,
+    github_route,
+    install_fake_agent_runtime,
+    llm_route,
+    route_github_to,
+)
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+# The handler functions timed as stages. Solver workers call the last four, so their
+# samples travel back through a multiprocessing queue.
+STAGES = {
+    "src.market_scan": ["async_market_scan_handler", "_create_proposal_for_instance"],
+    "src.solve_instances": [
+        "get_awarded_proposals",
+        "_get_instances_to_solve",
+        "_process_awarded_proposal",
+        "_solve_instance",
+        "_clean_response",
+        "_send_message",
+    ],
+}
+# Lower is better for every reported number except these.
+HIGHER_IS_BETTER = {"scan_cycles_per_second", "solve_cycles_per_second"}
+
+_samples: "multiprocessing.Queue[tuple[str, float]]"
+
+
+def _timed(stage: str, function):
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                _samples.put((stage, time.perf_counter() - started_at))
+
+        return async_wrapper
+
+    # functools.wraps keeps the qualified name, so the wrapper pickles by reference
+    # when it is submitted to the solver pool.
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _samples.put((stage, time.perf_counter() - started_at))
+
+    return wrapper
+
+
+def _instrument() -> None:
+    for module_name, names in STAGES.items():
+        module = importlib.import_module(module_name)
+        for name in names:
+            setattr(module, name, _timed(name, getattr(module, name)))
+
+
+def _configure_environment(args, market_url: str, llm_url: str, state_dir: str) -> None:
+    for name in ("OPENAI_API_KEY", "GITHUB_PAT", "GITHUB_USERNAME", "GITHUB_EMAIL"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ.update(
+        {
+            "MARKET_URL": market_url,
+            "MARKET_API_KEY": "benchmark",
+            "AGENT_TYPE": "aider",
+            "OPENAI_BASE_URL": f"{llm_url}/v1",
+            "MARKET_SCAN_INDEX_PATH": os.path.join(state_dir, "seen_instances.json"),
+            "SOLVE_LEDGER_PATH": os.path.join(state_dir, "solve_ledger.sqlite3"),
+            "GITHUB_CACHE_DIR": os.path.join(state_dir, "github_cache"),
+            "SOLVE_INSTANCES_MAX_CONCURRENCY": str(args.workers),
+        }
+    )
+    if args.page_size:
+        os.environ["MARKET_PAGE_SIZE"] = str(args.page_size)
+    if args.record:
+        os.environ["MARKET_RECORD_DIR"] = args.record
+    if args.replay:
+        os.environ["MARKET_REPLAY_DIR"] = args.replay
+        if args.replay_speed:
+            os.environ["MARKET_REPLAY_SPEED"] = str(args.replay_speed)
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if len(samples) == 1:
+        p50 = p95 = p99 = samples[0]
+    else:
+        cuts = statistics.quantiles(samples, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return {"count": len(samples), "p50_ms": p50 * 1e3, "p95_ms": p95 * 1e3, "p99_ms": p99 * 1e3}
+
+
+def _collect_samples(samples: dict[str, list[float]]) -> None:
+    # Read continuously: a full queue pipe would block the workers putting samples.
+    while True:
+        sample = _samples.get()
+        if sample is None:
+            return
+        stage, seconds = sample
+        samples.setdefault(stage, []).append(seconds)
+
+
+def run(args) -> dict:
+    global _samples
+    market = FakeMarket(args.instances, args.awards, args.chat_length, seed=args.seed)
+    servers = [
+        FakeServer(market.route, args.market_latency),
+        FakeServer(github_route, args.github_latency),
+        FakeServer(llm_route, args.llm_latency),
+    ]
+    for server in servers:
+        server.start()
+    market_server, github_server, llm_server = servers
+
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            _configure_environment(args, market_server.url, llm_server.url, state_dir)
+            route_github_to(github_server.url)
+            install_fake_agent_runtime(args.runtime_latency, "Please add tests for the fix.")
+            # Created before the solver pool forks, so the workers inherit it.
+            _samples = multiprocessing.Queue()
+            samples: dict[str, list[float]] = {}
+            collector = threading.Thread(target=_collect_samples, args=(samples,), daemon=True)
+            collector.start()
+
+            from src import market_scan, solve_instances
+
+            _instrument()
+
+            scan_cycles = []
+            for cycle in range(args.cycles):
+                # A replay already holds the changes recorded between cycles.
+                if cycle and not args.replay:
+                    market.churn(args.churn)
+                started_at = time.perf_counter()
+                market_scan.market_scan_handler()
+                scan_cycles.append(time.perf_counter() - started_at)
+
+            solve_cycles = []
+            outcomes: dict[str, int] = {}
+            for cycle in range(args.cycles):
+                if cycle and not args.replay:
+                    market.new_provider_messages(args.reply_share)
+                started_at = time.perf_counter()
+                report = solve_instances.solve_instances_handler()
+                solve_cycles.append(time.perf_counter() - started_at)
+                for outcome, count in report.outcomes.items():
+                    outcomes[outcome.value] = outcomes.get(outcome.value, 0) + count
+
+            if solve_instances._executor is not None:
+                solve_instances._executor.shutdown(wait=True)
+                solve_instances._executor = None
+            _samples.put(None)
+            collector.join()
+    finally:
+        for server in servers:
+            server.stop()
+
+    samples["scan_cycle"] = scan_cycles
+    samples["solve_cycle"] = solve_cycles
+    return {
+        "parameters": {
+            name: getattr(args, name)
+            for name in (
+                "instances",
+                "awards",
+                "cycles",
+                "chat_length",
+                "churn",
+                "reply_share",
+                "workers",
+                "page_size",
+                "market_latency",
+                "github_latency",
+                "llm_latency",
+                "runtime_latency",
+                "seed",
+                "replay",
+                "replay_speed",
+            )
+        },
+        "scan_cycles_per_second": len(scan_cycles) / sum(scan_cycles),
+        "solve_cycles_per_second": len(solve_cycles) / sum(solve_cycles),
+        "market_requests": market_server.requests,
+        "solve_outcomes": outcomes,
+        # ru_maxrss is in kilobytes on Linux. Children only count once they have exited.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "stages": {stage: _percentiles(values) for stage, values in sorted(samples.items())},
+    }
+
+
+def _flatten(results: dict) -> dict[str, float]:
+    flat = {
+        key: results[key]
+        for key in (
+            "scan_cycles_per_second",
+            "solve_cycles_per_second",
+            "peak_rss_mb",
+            "peak_worker_rss_mb",
+        )
+    }
+    for stage, stats in results["stages"].items():
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            flat[f"{stage}.{key}"] = stats[key]
+    return flat
+
+
+def print_results(results: dict) -> None:
+    print(f"Parameters: {json.dumps(results['parameters'])}")  # noqa: T201
+    print(  # noqa: T201
+        f"Scan cycles/s: {results['scan_cycles_per_second']:.2f}  "
+        f"solve cycles/s: {results['solve_cycles_per_second']:.2f}  "
+        f"market requests: {results['market_requests']}"
+    )
+    print(f"Solve outcomes: {json.dumps(results['solve_outcomes'])}")  # noqa: T201
+    print(  # noqa: T201
+        f"Peak RSS: {results['peak_rss_mb']:.1f} MB  "
+        f"worker peak RSS: {results['peak_worker_rss_mb']:.1f} MB"
+    )
+    print(f"{'stage':<30}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")  # noqa: T201
+    for stage, stats in results["stages"].items():
+        print(  # noqa: T201
+            f"{stage:<30}{stats['count']:>7}{stats['p50_ms']:>11.2f}"
+            f"{stats['p95_ms']:>11.2f}{stats['p99_ms']:>11.2f}"
+        )
+
+
+def _set_parameters(results: dict) -> dict:
+    # Unset options are left out, so baselines from before an option existed still match.
+    return {key: value for key, value in results["parameters"].items() if value is not None}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print the change of every metric against a baseline and return the regressions."""
+    if _set_parameters(baseline) != _set_parameters(results):
+        print("Warning: the baseline was recorded with different parameters")  # noqa: T201
+
+    current, previous = _flatten(results), _flatten(baseline)
+    regressions = []
+    print(f"{'metric':<40}{'baseline':>12}{'current':>12}{'change':>9}")  # noqa: T201
+    for metric, value in current.items():
+        if metric not in previous or not previous[metric]:
+            continue
+        change = value / previous[metric] - 1
+        regressed = -change > tolerance if metric in HIGHER_IS_BETTER else change > tolerance
+        marker = "  REGRESSION" if regressed else ""
+        print(  # noqa: T201
+            f"{metric:<40}{previous[metric]:>12.2f}{value:>12.2f}{change:>+9.1%}{marker}"
+        )
+        if regressed:
+            regressions.append(metric)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive the market scan and solve handlers against local fake services."
+    )
+    parser.add_argument("--instances", type=int, default=10_000, help="Open instances.")
+    parser.add_argument("--awards", type=int, default=500, help="Awarded proposals.")
+    parser.add_argument("--cycles", type=int, default=5, help="Cycles run per handler.")
+    parser.add_argument("--chat-length", type=int, default=4)
+    parser.add_argument(
+        "--churn", type=float, default=0.01, help="Share of open instances updated per cycle."
+    )
+    parser.add_argument(
+        "--reply-share",
+        type=float,
+        default=0.1,
+        help="Share of awarded conversations with a new provider message per cycle.",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Solver pool size.")
+    parser.add_argument("--page-size", type=int, default=None, help="Market list page size.")
+    parser.add_argument("--market-latency", type=float, default=0.001)
+    parser.add_argument("--github-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--runtime-latency", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", metavar="DIR", help="Record the market traffic to DIR.")
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="Replay the market traffic recorded in DIR instead of using the fake market.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=None,
+        help="Delay replayed responses by their recorded latency divided by this factor.",
+    )
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save the results as a baseline.")
+    parser.add_argument("--compare", metavar="NAME", help="Compare the results to a baseline.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative change past which a metric counts as a regression.",
+    )
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = run(args)
+    print_results(results)
+
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        baseline_path = BASELINE_DIR / f"{args.save_baseline}.json"
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Saved baseline to {baseline_path}")  # noqa: T201
+
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+# (status, headers, body) returned by a fake route.
+Reply = tuple[int, dict, bytes]
+Route = Callable[[str, str, dict, dict, bytes], Reply]
+
+PR_URL = "https://github.com/example/project/pull/{number}"
+
+
+def _json_reply(payload, headers: Optional[dict] = None) -> Reply:
+    return (
+        200,
+        {"Content-Type": "application/json", **(headers or {})},
+        json.dumps(payload).encode(),
+    )
+
+
+def _page(items: list, query: dict) -> list:
+    if "limit" not in query:
+        return items
+    offset = int(query.get("offset", 0))
+    return items[offset : offset + int(query["limit"])]
+
+
+class FakeServer:
+    """A local HTTP server answering every request through one route function."""
+
+    def __init__(self, route: Route, latency: float = 0.0):
+        self.route = route
+        self.latency = latency
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self) -> type:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so pooled clients reuse their connections like against the real API.
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self) -> None:
+                fake.requests += 1
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parsed = urlparse(self.path)
+                query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                if fake.latency:
+                    time.sleep(fake.latency)
+                try:
+                    status, headers, payload = fake.route(
+                        self.command, parsed.path, query, dict(self.headers), body
+                    )
+                except Exception as e:
+                    status, headers, payload = 500, {}, str(e).encode()
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class FakeMarket:
+    """In-memory market state served as the `/v1/instances`, `/v1/proposals` and `/v1/chat` API."""
+
+    def __init__(
+        self,
+        open_instances: int,
+        awards: int,
+        chat_length: int = 4,
+        github_share: float = 0.2,
+        seed: int = 0,
+    ):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._version = 0
+        now = datetime.utcnow()
+
+        self.open_instances = []
+        for number in range(open_instances):
+            background = f"Task {number}: implement the feature described in the ticket."
+            if self._random.random() < github_share:
+                background += f" Repository: https://github.com/example/repo-{number}"
+            self.open_instances.append(
+                {
+                    "id": f"open-{number}",
+                    "background": background,
+                    "status": 0,
+                    "updated_at": now.isoformat(),
+                }
+            )
+
+        self.instances = {instance["id"]: instance for instance in self.open_instances}
+        self.proposals = []
+        self.chats: dict[str, list[dict]] = {}
+        for number in range(awards):
+            instance_id = f"awarded-{number}"
+            self.instances[instance_id] = {
+                "id": instance_id,
+                "background": f"Awarded task {number}.",
+                "status": 3,
+                "updated_at": now.isoformat(),
+            }
+            self.proposals.append(
+                {
+                    "id": f"proposal-{instance_id}",
+                    "instance_id": instance_id,
+                    "status": 1,
+                    "creation_date": (now - timedelta(minutes=number)).isoformat(),
+                }
+            )
+            self.chats[instance_id] = []
+            for _ in range(chat_length):
+                self._append_message(instance_id, "provider")
+
+    def _append_message(self, instance_id: str, sender: str) -> None:
+        chat = self.chats[instance_id]
+        # The timestamp must grow per chat even when messages arrive within a microsecond.
+        timestamp = datetime.utcnow() + timedelta(microseconds=len(chat))
+        number = len(chat)
+        text = f"Message {number} from the {sender}."
+        if sender == "provider":
+            text = f"Updated the pull request: {PR_URL.format(number=number + 1)}"
+        chat.append({"timestamp": timestamp.isoformat(), "sender": sender, "message": text})
+
+    def churn(self, fraction: float) -> int:
+        """Update a share of the open instances, as new activity on the market would."""
+        with self._lock:
+            changed = self._random.sample(
+                self.open_instances, int(len(self.open_instances) * fraction)
+            )
+            now = datetime.utcnow().isoformat()
+            for instance in changed:
+                instance["updated_at"] = now
+            if changed:
+                self._version += 1
+        return len(changed)
+
+    def new_provider_messages(self, fraction: float) -> int:
+        """Make a share of the providers answer, so their conversations need a response."""
+        with self._lock:
+            instance_ids = self._random.sample(sorted(self.chats), int(len(self.chats) * fraction))
+            for instance_id in instance_ids:
+                self._append_message(instance_id, "provider")
+        return len(instance_ids)
+
+    def route(self, method: str, path: str, query: dict, headers: dict, body: bytes) -> Reply:
+        parts = [part for part in path.split("/") if part]
+        with self._lock:
+            if method == "GET" and parts == ["v1", "instances"]:
+                etag = f'"instances-{self._version}"'
+                if headers.get("If-None-Match") == etag:
+                    return 304, {"ETag": etag}, b""
+                status = int(query.get("instance_status", 0))
+                instances = [i for i in self.open_instances if i["status"] == status]
+                return _json_reply(_page(instances, query), {"ETag": etag})
+
+            if method == "GET" and parts[:2] == ["v1", "instances"] and len(parts) == 3:
+                if parts[2] not in self.instances:
+                    return 404, {}, b""
+                return _json_reply(self.instances[parts[2]])
+
+            if method == "GET" and parts == ["v1", "proposals"]:
+                # Newest first, like the market lists them.
+                return _json_reply(_page(self.proposals[::-1], query))
+
+            if method == "POST" and parts[:4] == ["v1", "proposals", "create", "for-instance"]:
+                self.proposals.append(
+                    {
+                        "id": f"proposal-{len(self.proposals)}",
+                        "instance_id": parts[4],
+                        "status": 0,
+                        "creation_date": datetime.utcnow().isoformat(),
+                        **json.loads(body or b"{}"),
+                    }
+                )
+                return _json_reply({"ok": True})
+
+            if method == "GET" and parts[:2] == ["v1", "chat"] and len(parts) == 3:
+                chat = self.chats.get(parts[2])
+                if chat is None:
+                    return _json_reply({"detail": "Chat not found"})
+                etag = f'"chat-{parts[2]}-{len(chat)}"'
+                if headers.get("If-None-Match") == etag:
+                    return 304, {"ETag": etag}, b""
+                return _json_reply(chat, {"ETag": etag})
+
+            if method == "POST" and parts[:3] == ["v1", "chat", "send-message"]:
+                self._append_message(parts[3], "requester")
+                return _json_reply({"ok": True})
+
+        return 404, {}, b""
+
+
+class FakeGitHub:
+    """Pull requests served as the GitHub GraphQL context query and the REST diff and files API.
+
+    Connections and file listings are split into pages of `page_size`, whatever size the
+    client asks for, so pagination is exercised with a handful of items.
+    """
+
+    def __init__(self, page_size: int = 2, login: str = "agentmarketbot"):
+        self.page_size = page_size
+        self.login = login
+        self.pulls: dict[tuple[str, str, int], dict] = {}
+        self.requests: list[tuple[str, str, dict]] = []
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def add_pull(
+        self,
+        owner: str,
+        name: str,
+        number: int,
+        files: list[dict],
+        comments: Optional[list[dict]] = None,
+        review_threads: Optional[list[list[dict]]] = None,
+        head_sha: str = "head-1",
+        base_sha: str = "base-1",
+    ) -> dict:
+        """Add a PR. Files have a path, additions, deletions, a GraphQL changeType and a patch."""
+        pull = {
+            "files": files,
+            "comments": comments or [],
+            "review_threads": review_threads or [],
+            "head_sha": head_sha,
+            "base_sha": base_sha,
+            "diff_too_large": False,
+        }
+        self.pulls[(owner, name, number)] = pull
+        return pull
+
+    def _connection(self, nodes: list, cursor: Optional[str]) -> dict:
+        start = int(cursor) if cursor else 0
+        page = nodes[start : start + self.page_size]
+        end = start + len(page)
+        return {
+            "pageInfo": {"hasNextPage": end < len(nodes), "endCursor": str(end) if page else None},
+            "nodes": page,
+        }
+
+    def _graphql(self, body: bytes) -> Reply:
+        variables = json.loads(body)["variables"]
+        pull = self.pulls[(variables["owner"], variables["name"], variables["number"])]
+        pull_request = {"headRefOid": pull["head_sha"], "baseRefOid": pull["base_sha"]}
+        if variables["withComments"]:
+            nodes = [
+                {"author": {"login": c["author"]}, "createdAt": c["createdAt"], "body": c["body"]}
+                for c in pull["comments"]
+            ]
+            pull_request["comments"] = self._connection(nodes, variables["commentsCursor"])
+        if variables["withThreads"]:
+            nodes = [
+                {
+                    "comments": {
+                        "nodes": [
+                            {**comment, "author": {"login": comment["author"]}}
+                            for comment in thread
+                        ]
+                    }
+                }
+                for thread in pull["review_threads"]
+            ]
+            pull_request["reviewThreads"] = self._connection(nodes, variables["threadsCursor"])
+        if variables["withFiles"]:
+            nodes = [
+                {key: file[key] for key in ("path", "additions", "deletions", "changeType")}
+                for file in pull["files"]
+            ]
+            pull_request["files"] = self._connection(nodes, variables["filesCursor"])
+        return _json_reply(
+            {
+                "data": {
+                    "viewer": {"login": self.login},
+                    "repository": {"pullRequest": pull_request},
+                }
+            }
+        )
+
+    @staticmethod
+    def diff(pull: dict) -> str:
+        return "".join(
+            f"diff --git a/{file['path']} b/{file['path']}\n"
+            f"--- a/{file['path']}\n+++ b/{file['path']}\n{file['patch']}\n"
+            for file in pull["files"]
+            if file.get("patch")
+        )
+
+    def _pull_diff(self, pull: dict, headers: dict) -> Reply:
+        if pull["diff_too_large"]:
+            return 406, {"Content-Type": "application/json"}, b'{"message": "diff too large"}'
+        diff = self.diff(pull)
+        etag = f'"{hashlib.sha256(diff.encode()).hexdigest()[:16]}"'
+        if headers.get("if-none-match") == etag:
+            self.not_modified += 1
+            return 304, {"ETag": etag}, b""
+        return 200, {"Content-Type": "text/plain", "ETag": etag}, diff.encode()
+
+    def _pull_files(self, pull: dict, path: str, query: dict, headers: dict) -> Reply:
+        per_page = min(int(query.get("per_page", 30)), self.page_size)
+        page = int(query.get("page", 1))
+        files = pull["files"][(page - 1) * per_page : page * per_page]
+        reply_headers = {}
+        if page * per_page < len(pull["files"]):
+            next_url = f"http://{headers['host']}{path}?per_page={per_page}&page={page + 1}"
+            reply_headers["Link"] = f'<{next_url}>; rel="next"'
+        return _json_reply(
+            [{"filename": file["path"], "patch": file.get("patch")} for file in files],
+            reply_headers,
+        )
+
+    def route(self, method: str, path: str, query: dict, headers: dict, body: bytes) -> Reply:
+        headers = {name.lower(): value for name, value in headers.items()}
+        with self._lock:
+            self.requests.append((method, path, json.loads(body) if body else query))
+            if method == "POST" and path == "/graphql":
+                return self._graphql(body)
+
+            parts = path.strip("/").split("/")
+            if method == "GET" and len(parts) >= 5 and parts[0] == "repos" and parts[3] == "pulls":
+                pull = self.pulls.get((parts[1], parts[2], int(parts[4])))
+                if pull is None:
+                    return 404, {}, b""
+                if parts[5:] == ["files"]:
+                    return self._pull_files(pull, path, query, headers)
+                if not parts[5:]:
+                    return self._pull_diff(pull, headers)
+
+        return 404, {}, b""
+
+
+def github_route(method: str, path: str, query: dict, headers: dict, body: bytes) -> Reply:
+    """Serve pull request pages with the fork branch and linked issue the solver looks for."""
+    number = path.rstrip("/").rsplit("/", 1)[-1]
+    page = (
+        "<html><body>"
+        f'<span title="agentmarketbot/project:fix-{number}">agentmarketbot:fix-{number}</span>'
+        f'<a href="https://github.com/example/project/issues/{number}">Fixes #{number}</a>'
+        "</body></html>"
+    )
+    return 200, {"Content-Type": "text/html"}, page.encode()
+
+
+def llm_route(method: str, path: str, query: dict, headers: dict, body: bytes) -> Reply:
+    """Answer every chat completion with the same review comments."""
+    request = json.loads(body or b"{}")
+    return _json_reply(
+        {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "- Add tests for the new branch."},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110},
+        }
+    )
+
+
+def route_github_to(base_url: str) -> None:
+    """Send the solver's plain `httpx.get` calls for github.com to a fake GitHub."""
+    original_get = httpx.get
+
+    def get(url, *args, **kwargs):
+        url = str(url)
+        if url.startswith("https://github.com"):
+            url = base_url + url[len("https://github.com") :]
+        return original_get(url, *args, **kwargs)
+
+    httpx.get = get
+
+
+def install_fake_agent_runtime(latency: float, response: str) -> None:
+    """Replace the Aider runtime with one that takes a fixed time and returns a canned review.
+
+    Solver workers import the runtime lazily, so the replacement must be in place before
+    the solver pool starts.
+    """
+
+    def modify_repo_with_aider(model_name, solver_command, repo_info=None) -> str:
+        time.sleep(latency)
+        return response
+
+    module = types.ModuleType("src.agents.aider_modify_repo")
+    module.modify_repo_with_aider = modify_repo_with_aider
+    sys.modules[module.__name__] = module
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ENTRY_POINTS = ["main", "src.market_scan", "src.solve_instances"]
+HEAVY_MODULES = ["aider", "openai", "github", "git", "docker", "tiktoken"]
+
+# Runs in a fresh interpreter, so every measurement is a cold start.
+_PROBE = """
+import json, sys, time
+started_at = time.perf_counter()
+import {module}
+import_seconds = time.perf_counter() - started_at
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": import_seconds, "modules": len(sys.modules), "heavy": heavy}}))
+"""
+
+
+def measure(module: str, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=REPO_ROOT,
+            env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1]
+            return {"entry_point": module, "error": error}
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    seconds = [sample["seconds"] for sample in samples]
+    return {
+        "entry_point": module,
+        "median_ms": statistics.median(seconds) * 1e3,
+        "min_ms": min(seconds) * 1e3,
+        "modules": samples[0]["modules"],
+        "heavy": samples[0]["heavy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold import time of entry points.")
+    parser.add_argument("--entry-points", nargs="+", default=ENTRY_POINTS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [measure(module, args.runs) for module in args.entry_points]
+
+    print(  # noqa: T201
+        f"{'entry point':<22}{'median ms':>11}{'min ms':>9}{'modules':>9}  heavy imports"
+    )
+    for r in results:
+        if "error" in r:
+            print(f"{r['entry_point']:<22}  failed: {r['error']}")  # noqa: T201
+            continue
+        print(  # noqa: T201
+            f"{r['entry_point']:<22}{r['median_ms']:>11.1f}{r['min_ms']:>9.1f}{r['modules']:>9}"
+            f"  {', '.join(r['heavy']) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
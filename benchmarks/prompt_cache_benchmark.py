@@ -0,0 +1,135 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from loguru import logger
+
+from src.agents.prompt_cache import PromptCache
+
+
+class LegacyFilePromptCache:
+    """The previous file-per-entry layout, kept here as the benchmark baseline."""
+
+    def __init__(self, cache_dir: str, cache_ttl_days: int = 30):
+        self.cache_dir = Path(cache_dir)
+        self.cache_ttl = timedelta(days=cache_ttl_days)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _cache_file(self, prompt: str, model_name: str) -> Path:
+        cache_key = hashlib.sha256(f"{prompt}:{model_name}".encode()).hexdigest()
+        return self.cache_dir / f"{cache_key}.json"
+
+    def get(self, prompt: str, model_name: str):
+        cache_file = self._cache_file(prompt, model_name)
+        if not cache_file.exists():
+            return None
+        with open(cache_file, "r") as f:
+            cache_data = json.load(f)
+        if datetime.now() - datetime.fromisoformat(cache_data["timestamp"]) > self.cache_ttl:
+            return None
+        return cache_data["response"]
+
+    def store(self, prompt: str, model_name: str, response: str) -> None:
+        cache_data = {
+            "prompt": prompt,
+            "model_name": model_name,
+            "response": response,
+            "timestamp": datetime.now().isoformat(),
+        }
+        with open(self._cache_file(prompt, model_name), "w") as f:
+            json.dump(cache_data, f)
+
+    def cleanup_expired(self) -> None:
+        for cache_file in self.cache_dir.glob("*.json"):
+            with open(cache_file, "r") as f:
+                cache_data = json.load(f)
+            if datetime.now() - datetime.fromisoformat(cache_data["timestamp"]) > self.cache_ttl:
+                cache_file.unlink()
+
+
+def _disk_usage(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+
+def _make_response(i: int, size: int) -> str:
+    line = f"Applied edit {i} to src/module_{i % 97}.py: refactored helper and updated tests.\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def _timed(fn) -> float:
+    started_at = time.perf_counter()
+    fn()
+    return time.perf_counter() - started_at
+
+
+def run_benchmark(name: str, cache, entries: int, lookups: int, response_size: int) -> dict:
+    prompts = [f"Solve instance {i}" for i in range(entries)]
+    model_name = "gpt-4o"
+
+    def populate():
+        for i, prompt in enumerate(prompts):
+            cache.store(prompt, model_name, _make_response(i, response_size))
+
+    def lookup():
+        for prompt in random.sample(prompts, min(lookups, entries)):
+            cache.get(prompt, model_name)
+
+    return {
+        "backend": name,
+        "entries": entries,
+        "store_per_entry_us": _timed(populate) / entries * 1e6,
+        "get_per_lookup_us": _timed(lookup) / min(lookups, entries) * 1e6,
+        "cleanup_expired_ms": _timed(cache.cleanup_expired) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PromptCache backends.")
+    parser.add_argument("--entries", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--lookups", type=int, default=1_000)
+    parser.add_argument("--response-size", type=int, default=2_048)
+    args = parser.parse_args()
+
+    logger.remove()
+    random.seed(0)
+    results = []
+    for entries in args.entries:
+        with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as db_dir:
+            legacy = LegacyFilePromptCache(legacy_dir)
+            result = run_benchmark(
+                "file-per-entry", legacy, entries, args.lookups, args.response_size
+            )
+            result["disk_mb"] = _disk_usage(legacy_dir) / 1024 / 1024
+            results.append(result)
+
+            indexed = PromptCache(db_dir, max_entries=entries, max_bytes=2**40)
+            result = run_benchmark(
+                "sqlite-index", indexed, entries, args.lookups, args.response_size
+            )
+            result["disk_mb"] = _disk_usage(db_dir) / 1024 / 1024
+            results.append(result)
+
+    header = (
+        f"{'backend':<16}{'entries':>10}{'store us':>12}{'get us':>10}"
+        f"{'cleanup ms':>13}{'disk MB':>10}"
+    )
+    print(header)  # noqa: T201
+    for r in results:
+        print(  # noqa: T201
+            f"{r['backend']:<16}{r['entries']:>10}{r['store_per_entry_us']:>12.1f}"
+            f"{r['get_per_lookup_us']:>10.1f}{r['cleanup_expired_ms']:>13.1f}{r['disk_mb']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
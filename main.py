@@ -1,44 +1,67 @@
 import multiprocessing
 import sys
-import time
+from multiprocessing.synchronize import Event
 
 from loguru import logger
 
-from src.market_scan import market_scan_handler
-from src.solve_instances import solve_instances_handler
+from src import metrics
+from src.config import SETTINGS
+from src.enums import SolveOutcome
+from src.scheduler import AdaptiveScheduler
 
 
-def run_market_scan():
-    while True:
-        try:
-            logger.info("Starting market scan")
-            market_scan_handler()
-            logger.info("Market scan completed successfully")
-            logger.info("Waiting 10 seconds before next market scan...")
-            time.sleep(10)
-        except Exception as e:
-            logger.info("Market scan iteration skipped")
-            time.sleep(10)
+def _build_scheduler(
+    name: str, wake_event: Event = None, max_interval: float = None
+) -> AdaptiveScheduler:
+    return AdaptiveScheduler(
+        name,
+        min_interval=SETTINGS.scheduler_min_interval,
+        base_interval=SETTINGS.scheduler_base_interval,
+        max_interval=max_interval or SETTINGS.scheduler_max_interval,
+        wake_event=wake_event,
+    )
 
 
-def run_solve_instances():
-    while True:
-        try:
-            logger.info("Starting solve_instances")
-            solve_instances_handler()
-            logger.info("solve_instances completed successfully")
-            logger.info("Waiting 10 seconds before next solve_instances...")
-            time.sleep(10)
-        except Exception as e:
-            logger.info("Solve instances iteration skipped")
-            time.sleep(10)
+def run_market_scan(solver_wake_event: Event):
+    # Each process imports only its own handler, so the market scan never loads Aider.
+    from src.market_scan import market_scan_handler
+
+    scheduler = _build_scheduler("market scan")
+    # The solver acts on awarded proposals, so it is woken up when the scan sees a new one.
+    scheduler.run_forever(lambda: market_scan_handler(on_award=solver_wake_event.set) > 0)
+
+
+def run_solve_instances(solver_wake_event: Event):
+    from src.solve_instances import solve_instances_handler
+
+    def solve_cycle() -> bool:
+        # Only deliveries count as work, so instances that needed no reply do not keep the
+        # solver polling at the minimum interval.
+        report = solve_instances_handler()
+        return report.outcomes.get(SolveOutcome.delivered, 0) > 0
+
+    # Provider replies in awarded chats are only seen by polling, so the solver backs off
+    # no further than its own cap.
+    scheduler = _build_scheduler(
+        "solve_instances",
+        wake_event=solver_wake_event,
+        max_interval=SETTINGS.scheduler_solve_max_interval,
+    )
+    scheduler.run_forever(solve_cycle)
 
 
 def main():
     logger.info("Starting application...")
 
-    market_scan_process = multiprocessing.Process(target=run_market_scan)
-    solve_instances_process = multiprocessing.Process(target=run_solve_instances)
+    if SETTINGS.metrics_port:
+        metrics.reset_snapshots(SETTINGS.metrics_dir)
+        metrics.serve_metrics(SETTINGS.metrics_host, SETTINGS.metrics_port, SETTINGS.metrics_dir)
+
+    solver_wake_event = multiprocessing.Event()
+    market_scan_process = multiprocessing.Process(target=run_market_scan, args=(solver_wake_event,))
+    solve_instances_process = multiprocessing.Process(
+        target=run_solve_instances, args=(solver_wake_event,)
+    )
 
     market_scan_process.start()
     solve_instances_process.start()
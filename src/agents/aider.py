@@ -1,79 +1,90 @@
 import os
 import shlex
 
-import openai
 from dotenv import load_dotenv
 from loguru import logger
 
-from src.config import SETTINGS
+from src import metrics
+from src.utils.llm_client import chat_completion
+
+from .test_command import (
+    README_FILES,
+    find_readme,
+    get_or_compute_test_command,
+    infer_test_command,
+    read_top_level_files,
+)
 
 load_dotenv()
-openai.api_key = SETTINGS.openai_api_key
 WEAK_MODEL = "gpt-4o-mini"
 
 
-def _get_readme_content(repo_path: str) -> str:
+def _get_readme_content(repo_path: str, top_level_files: dict[str, str]) -> str:
     logger.info(f"Searching for README files in the repository: {repo_path}")
-    readme_files = ["README.md", "README.txt", "README.rst", "README"]
-
-    for root, _, files in os.walk(repo_path):
-        for file in files:
-            if file in readme_files:
-                readme_path = os.path.join(root, file)
-                logger.info(f"README file found: {readme_path}")
-                try:
-                    with open(readme_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                        logger.debug(f"README content loaded successfully from {readme_path}")
-                        return content
-                except Exception as e:
-                    logger.error(f"Error reading README file {readme_path}: {e}")
-                    return ""
-    logger.warning("No README file found in the repository.")
-    return ""
+    for name in README_FILES:
+        if name in top_level_files:
+            logger.info(f"README file found: {os.path.join(repo_path, name)}")
+            return top_level_files[name]
+
+    content = find_readme(repo_path)
+    if content is None:
+        logger.warning("No README file found in the repository.")
+        return ""
+    return content
+
+
+@metrics.timed("llm_call_duration_seconds", call_site="suggest_test_command")
+def _suggest_test_command_with_llm(readme_content: str) -> str:
+    logger.info("Requesting OpenAI to generate a test command based on README content.")
+    command = chat_completion(
+        WEAK_MODEL,
+        [
+            {
+                "role": "system",
+                "content": (
+                    "You are an assistant that provides Shell commands to run tests "
+                    "based on project documentation. You don't format your answer and "
+                    "provide raw text."
+                ),
+            },
+            {
+                "role": "user",
+                "content": (
+                    "Based on the following README content, "
+                    "provide a single shell command necessary to run the project tests. "
+                    "Make sure to output a single command. Example: `make tests`."
+                    "If the content doesn't specify how to run tests, do not output anything:"
+                    "\n\n"
+                    f"{readme_content}"
+                ),
+            },
+        ],
+    )
+    if command:
+        logger.info(f"Test command successfully generated: {command}")
+    else:
+        logger.warning("No suitable test command found in the OpenAI response.")
+    return command
 
 
 def suggest_test_command(repo_path: str) -> str:
     logger.info(f"Starting test command suggestion process for repo: {repo_path}")
-    readme_content = _get_readme_content(repo_path)
+    top_level_files = read_top_level_files(repo_path)
 
-    if not readme_content:
-        logger.warning("No README content available to analyze for test commands.")
-        return ""
-
-    logger.info("Requesting OpenAI to generate a test command based on README content.")
-    try:
-        response = openai.chat.completions.create(
-            model=WEAK_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an assistant that provides Shell commands to run tests "
-                        "based on project documentation. You don't format your answer and "
-                        "provide raw text."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        "Based on the following README content, "
-                        "provide a single shell command necessary to run the project tests. "
-                        "Make sure to output a single command. Example: `make tests`."
-                        "If the content doesn't specify how to run tests, do not output anything:"
-                        "\n\n"
-                        f"{readme_content}"
-                    ),
-                },
-            ],
-        )
-        command = response.choices[0].message.content.strip()
+    def compute() -> str:
+        command = infer_test_command(top_level_files)
         if command:
-            logger.info(f"Test command successfully generated: {command}")
+            logger.info(f"Test command inferred from the build manifests: {command}")
             return command
-        else:
-            logger.warning("No suitable test command found in the OpenAI response.")
+
+        readme_content = _get_readme_content(repo_path, top_level_files)
+        if not readme_content:
+            logger.warning("No README content available to analyze for test commands.")
             return ""
+        return _suggest_test_command_with_llm(readme_content)
+
+    try:
+        return get_or_compute_test_command(repo_path, top_level_files, compute)
     except Exception as e:
         logger.error(f"Error during OpenAI API call: {e}")
         return ""
@@ -106,6 +117,8 @@ def get_container_kwargs(
     }
     user = f"{os.getuid()}:{os.getgid()}"
     kwargs = {
+        # Passing the workspace lets a warm pooled container run the job.
+        "repo_directory": repo_directory,
         "image": "paulgauthier/aider",
         "entrypoint": entrypoint,
         "environment": env_vars,
@@ -1,5 +1,6 @@
 import os
-from datetime import datetime
+import uuid
+from typing import Optional
 
 from dotenv import load_dotenv
 
@@ -20,20 +21,48 @@ _MODEL_ALIAS_TO_API_KEY_ENV_VAR_NAME: dict[ModelName, str] = {
 _DOCKER_IMAGE = "docker.all-hands.dev/all-hands-ai/openhands:0.15"
 _RUNTIME_IMAGE = "docker.all-hands.dev/all-hands-ai/runtime:0.15-nikolaik"
 _DOCKER_NETWORK_HOST = ["host.docker.internal:host-gateway"]
+# OpenHands names the sandbox it starts through the docker socket
+# `openhands-runtime-<session>-<hash>`, after the session name it is given.
+_RUNTIME_CONTAINER_PREFIX = "openhands-runtime-"
+_SESSION_PREFIX = "agent-market-"
+
+
+def runtime_container_prefix(job_id: Optional[str] = None) -> str:
+    """Return the name prefix of the sandbox containers of a job, or of any job."""
+    return f"{_RUNTIME_CONTAINER_PREFIX}{_SESSION_PREFIX}{f'{job_id}-' if job_id else ''}"
+
+
+def runtime_container_job_id(name: str) -> Optional[str]:
+    """Return the job ID a sandbox container was started for, from its name."""
+    prefix = runtime_container_prefix()
+    if not name.startswith(prefix) or "-" not in name[len(prefix) :]:
+        return None
+    return name[len(prefix) :].rsplit("-", 1)[0]
 
 
 def get_container_kwargs(
     repo_directory: str,
     solver_command: str,
     model_name: ModelName,
+    job_id: Optional[str] = None,
 ) -> str:
+    job_id = job_id or uuid.uuid4().hex
     solver_command += (
         "\n\n=== SYSTEM REQUIREMENTS ===\n"
         "MAKE SURE YOU COMMIT TO THE REPOSITORY THE CHANGES PROPOSED. "
         "NEVER PUSH THE CHANGES. "
         "ALWAYS STAY IN THE SAME REPOSITORY BRANCH."
     )
-    entrypoint = ["python", "-m", "openhands.core.main", "-t", solver_command, "--no-auto-continue"]
+    entrypoint = [
+        "python",
+        "-m",
+        "openhands.core.main",
+        "-t",
+        solver_command,
+        "--no-auto-continue",
+        "--name",
+        f"{_SESSION_PREFIX}{job_id}",
+    ]
     env_vars = {
         "SANDBOX_RUNTIME_CONTAINER_IMAGE": _RUNTIME_IMAGE,
         "SANDBOX_USER_ID": str(os.getuid()),
@@ -51,8 +80,10 @@ def get_container_kwargs(
         repo_directory: {"bind": "/opt/workspace_base", "mode": "rw"},
         "/var/run/docker.sock": {"bind": "/var/run/docker.sock", "mode": "rw"},
     }
-    container_name = f"openhands-app-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    container_name = f"openhands-app-{uuid.uuid4().hex[:12]}"
     kwargs = {
+        # Launching with this job ID lets the job's cleanup find the sandbox too.
+        "job_id": job_id,
         "image": _DOCKER_IMAGE,
         "entrypoint": entrypoint,
         "environment": env_vars,
@@ -1,80 +1,254 @@
-import json
+import hashlib
 import os
-from datetime import datetime, timedelta
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 from loguru import logger
 
+from src import metrics
+from src.utils.process_utils import ProcessLocalDatabase, is_process_alive
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_expires_at ON entries (expires_at);
+CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (id, entries, bytes) VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_after_insert AFTER INSERT ON entries BEGIN
+    UPDATE stats SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_after_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE stats SET bytes = bytes + NEW.size - OLD.size WHERE id = 0;
+END;
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    owner_pid INTEGER NOT NULL,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failures (
+    key TEXT PRIMARY KEY,
+    failed_at REAL NOT NULL,
+    error TEXT
+);
+CREATE TRIGGER IF NOT EXISTS entries_after_delete AFTER DELETE ON entries BEGIN
+    UPDATE stats SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0;
+END;
+"""
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    memory_evictions: int = 0
+    disk_evictions: int = 0
+    coalesced: int = 0
+
+
+@dataclass
+class _Flight:
+    """One computation in this process, whose outcome the callers waiting for it share."""
+
+    event: threading.Event = field(default_factory=threading.Event)
+    response: Optional[str] = None
+    error: Optional[BaseException] = None
+
 
 class PromptCache:
-    def __init__(self, cache_dir: str = "/tmp/aider_cache/prompts", cache_ttl_days: int = 30):
+    def __init__(
+        self,
+        cache_dir: str = "/tmp/aider_cache/prompts",
+        cache_ttl_days: int = 30,
+        max_entries: int = 10_000,
+        max_bytes: int = 512 * 1024 * 1024,
+        memory_max_entries: int = 256,
+        inflight_timeout: float = 3600,
+    ):
         self.cache_dir = Path(cache_dir)
         self.cache_ttl = timedelta(days=cache_ttl_days)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        logger.info(
-            f"Initialized prompt cache at {self.cache_dir} with TTL of {cache_ttl_days} days"
-        )
+        self.db_path = self.cache_dir / "prompt_cache.sqlite3"
+        self._database = ProcessLocalDatabase(self.db_path, _SCHEMA)
+        self._lock = threading.Lock()
+        self.memory_max_entries = memory_max_entries
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.inflight_timeout = inflight_timeout
+        self._inflight: dict[str, _Flight] = {}
+        self.stats = CacheStats()
+        self._connect()
+        logger.info(f"Initialized prompt cache at {self.db_path} with TTL of {cache_ttl_days} days")
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._database.connect()
 
     def _get_cache_key(self, prompt: str, model_name: str) -> str:
         """Generate a unique cache key based on the prompt and model."""
-        import hashlib
-
         # Create a unique key based on both prompt and model name
         combined = f"{prompt}:{model_name}"
         return hashlib.sha256(combined.encode()).hexdigest()
 
-    def _is_cache_valid(self, timestamp: datetime) -> bool:
-        """Check if the cache entry is still valid based on TTL."""
-        return datetime.now() - timestamp <= self.cache_ttl
+    def _memory_get(self, cache_key: str, now: float) -> Optional[str]:
+        entry = self._memory.get(cache_key)
+        if entry is None:
+            return None
+
+        response, expires_at = entry
+        if expires_at <= now:
+            del self._memory[cache_key]
+            return None
+
+        self._memory.move_to_end(cache_key)
+        return response
+
+    def _memory_put(self, cache_key: str, response: str, expires_at: float) -> None:
+        self._memory[cache_key] = (response, expires_at)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self.stats.memory_evictions += 1
+
+    def _record_lookup(self, result: str) -> None:
+        metrics.inc("prompt_cache_lookups_total", cache=self.cache_dir.name, result=result)
 
     def get(self, prompt: str, model_name: str) -> Optional[str]:
         """Retrieve a cached response for a given prompt and model."""
-        cache_key = self._get_cache_key(prompt, model_name)
-        cache_file = self.cache_dir / f"{cache_key}.json"
+        return self._get(self._get_cache_key(prompt, model_name))
 
-        if not cache_file.exists():
-            return None
+    def _get(self, cache_key: str) -> Optional[str]:
+        now = time.time()
 
         try:
-            with open(cache_file, "r") as f:
-                cache_data = json.load(f)
-                timestamp = datetime.fromisoformat(cache_data["timestamp"])
+            with self._lock:
+                response = self._memory_get(cache_key, now)
+                if response is not None:
+                    self.stats.memory_hits += 1
+                    self._record_lookup("memory_hit")
+                    logger.info(f"Memory cache hit for prompt with key {cache_key}")
+                    return response
 
-                if not self._is_cache_valid(timestamp):
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT payload, expires_at FROM entries WHERE key = ?", (cache_key,)
+                ).fetchone()
+                if row is None:
+                    self.stats.misses += 1
+                    self._record_lookup("miss")
+                    return None
+
+                payload, expires_at = row
+                if expires_at <= now:
                     logger.info(f"Cache entry expired for key {cache_key}")
-                    cache_file.unlink()
+                    connection.execute("DELETE FROM entries WHERE key = ?", (cache_key,))
+                    self.stats.misses += 1
+                    self._record_lookup("miss")
                     return None
 
-                logger.info(f"Cache hit for prompt with key {cache_key}")
-                return cache_data["response"]
+                connection.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?", (now, cache_key)
+                )
+                response = zlib.decompress(payload).decode("utf-8")
+                self._memory_put(cache_key, response, expires_at)
+                self.stats.disk_hits += 1
+                self._record_lookup("disk_hit")
+
+            logger.info(f"Cache hit for prompt with key {cache_key}")
+            return response
         except Exception as e:
-            logger.error(f"Error reading cache file {cache_file}: {e}")
+            logger.error(f"Error reading cache entry {cache_key}: {e}")
             return None
 
     def store(self, prompt: str, model_name: str, response: str) -> None:
         """Store a prompt-response pair in the cache."""
-        cache_key = self._get_cache_key(prompt, model_name)
-        cache_file = self.cache_dir / f"{cache_key}.json"
+        self._store(self._get_cache_key(prompt, model_name), model_name, response)
+
+    def _store(self, cache_key: str, model_name: str, response: str) -> None:
+        payload = zlib.compress(response.encode("utf-8"))
+        now = time.time()
+        expires_at = now + self.cache_ttl.total_seconds()
 
         try:
-            cache_data = {
-                "prompt": prompt,
-                "model_name": model_name,
-                "response": response,
-                "timestamp": datetime.now().isoformat(),
-            }
-            with open(cache_file, "w") as f:
-                json.dump(cache_data, f)
+            with self._lock:
+                self._memory_put(cache_key, response, expires_at)
+                connection = self._connect()
+                # An upsert rather than INSERT OR REPLACE, so the stats triggers see the
+                # replaced entry as an update instead of missing its implicit delete.
+                connection.execute("DELETE FROM failures WHERE key = ?", (cache_key,))
+                connection.execute(
+                    "INSERT INTO entries "
+                    "(key, model_name, payload, size, created_at, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET payload = excluded.payload, "
+                    "size = excluded.size, created_at = excluded.created_at, "
+                    "expires_at = excluded.expires_at, last_access = excluded.last_access",
+                    (
+                        cache_key,
+                        model_name,
+                        payload,
+                        len(payload),
+                        now,
+                        expires_at,
+                        now,
+                    ),
+                )
+                self._evict(connection)
             logger.info(f"Stored response in cache with key {cache_key}")
         except Exception as e:
-            logger.error(f"Error writing to cache file {cache_file}: {e}")
+            logger.error(f"Error writing cache entry {cache_key}: {e}")
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Evict least recently used entries until the entry and byte caps are met."""
+        count, total_bytes = connection.execute(
+            "SELECT entries, bytes FROM stats WHERE id = 0"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        evicted_keys = []
+        cursor = connection.execute("SELECT key, size FROM entries ORDER BY last_access")
+        for key, size in cursor:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            count -= 1
+            total_bytes -= size
+        cursor.close()
+
+        connection.executemany("DELETE FROM entries WHERE key = ?", evicted_keys)
+        for (key,) in evicted_keys:
+            self._memory.pop(key, None)
+        self.stats.disk_evictions += len(evicted_keys)
+        logger.info(f"Evicted {len(evicted_keys)} least recently used cache entries")
 
     def clear(self) -> None:
         """Clear all cached prompts."""
         try:
-            for cache_file in self.cache_dir.glob("*.json"):
-                cache_file.unlink()
+            with self._lock:
+                self._memory.clear()
+                connection = self._connect()
+                connection.execute("DELETE FROM entries")
+                connection.execute("DELETE FROM failures")
             logger.info("Cleared prompt cache")
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
@@ -82,16 +256,148 @@ class PromptCache:
     def cleanup_expired(self) -> None:
         """Remove all expired cache entries."""
         try:
-            for cache_file in self.cache_dir.glob("*.json"):
-                try:
-                    with open(cache_file, "r") as f:
-                        cache_data = json.load(f)
-                        timestamp = datetime.fromisoformat(cache_data["timestamp"])
-                        if not self._is_cache_valid(timestamp):
-                            cache_file.unlink()
-                            logger.info(f"Removed expired cache entry: {cache_file.name}")
-                except Exception as e:
-                    logger.error(f"Error processing cache file {cache_file}: {e}")
-                    cache_file.unlink()  # Remove corrupted cache files
+            with self._lock:
+                cursor = self._connect().execute(
+                    "DELETE FROM entries WHERE expires_at <= ?", (time.time(),)
+                )
+            if cursor.rowcount:
+                logger.info(f"Removed {cursor.rowcount} expired cache entries")
         except Exception as e:
             logger.error(f"Error during cache cleanup: {e}")
+
+    def _try_acquire_lease(self, cache_key: str) -> bool:
+        """Try to become the single process computing the entry for a key."""
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT owner_pid, started_at FROM inflight WHERE key = ?", (cache_key,)
+            ).fetchone()
+            if row is not None:
+                owner_pid, started_at = row
+                if is_process_alive(owner_pid) and now - started_at < self.inflight_timeout:
+                    return False
+                connection.execute(
+                    "DELETE FROM inflight WHERE key = ? AND owner_pid = ?", (cache_key, owner_pid)
+                )
+
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO inflight (key, owner_pid, started_at) VALUES (?, ?, ?)",
+                (cache_key, os.getpid(), now),
+            )
+            return cursor.rowcount == 1
+
+    def _release_lease(self, cache_key: str) -> None:
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM inflight WHERE key = ? AND owner_pid = ?", (cache_key, os.getpid())
+            )
+
+    def get_or_compute(
+        self,
+        prompt: str,
+        model_name: str,
+        compute: Callable[[], Optional[str]],
+        poll_interval: float = 1.0,
+    ) -> Optional[str]:
+        """Return the cached response, or compute it once for all concurrent callers.
+
+        Callers that waited for a computation get its outcome, including an empty
+        response or an error, rather than computing again.
+        """
+        cache_key = self._get_cache_key(prompt, model_name)
+        response = self._get(cache_key)
+        if response is not None:
+            return response
+
+        with self._lock:
+            flight = self._inflight.get(cache_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._inflight[cache_key] = _Flight()
+
+        if not is_leader:
+            self.stats.coalesced += 1
+            logger.info(f"Waiting for in-flight computation of key {cache_key}")
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        try:
+            flight.response = self._compute_once(cache_key, model_name, compute, poll_interval)
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[cache_key]
+            flight.event.set()
+
+    def _compute_once(
+        self,
+        cache_key: str,
+        model_name: str,
+        compute: Callable[[], Optional[str]],
+        poll_interval: float,
+    ) -> Optional[str]:
+        """Compute the entry of a key, or take the outcome of the process computing it."""
+        waiting_since = None
+        while not self._try_acquire_lease(cache_key):
+            if waiting_since is None:
+                waiting_since = time.time()
+                self.stats.coalesced += 1
+                logger.info(f"Another process is computing key {cache_key}, waiting")
+            time.sleep(poll_interval)
+
+        try:
+            if waiting_since is not None:
+                response = self._get(cache_key)
+                if response is not None:
+                    return response
+                failure = self._get_failure(cache_key, waiting_since)
+                if failure is not None:
+                    error = failure[0]
+                    if error:
+                        raise RuntimeError(f"Computation failed in another process: {error}")
+                    logger.info(f"Computation of key {cache_key} in another process gave no result")
+                    return None
+
+            try:
+                response = compute()
+            except Exception as e:
+                self._record_failure(cache_key, str(e) or type(e).__name__)
+                raise
+            if response:
+                self._store(cache_key, model_name, response)
+            else:
+                self._record_failure(cache_key, None)
+            return response
+        finally:
+            self._release_lease(cache_key)
+
+    def _record_failure(self, cache_key: str, error: Optional[str]) -> None:
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO failures (key, failed_at, error) VALUES (?, ?, ?)",
+                (cache_key, time.time(), error),
+            )
+
+    def _get_failure(self, cache_key: str, since: float) -> Optional[tuple[Optional[str]]]:
+        """Return the error of a computation that failed since a time, if one did."""
+        with self._lock:
+            connection = self._connect()
+            return connection.execute(
+                "SELECT error FROM failures WHERE key = ? AND failed_at >= ?", (cache_key, since)
+            ).fetchone()
+
+
+_prompt_cache: Optional[PromptCache] = None
+
+
+def get_prompt_cache() -> PromptCache:
+    global _prompt_cache
+    if _prompt_cache is None:
+        _prompt_cache = PromptCache()
+    return _prompt_cache
@@ -26,6 +26,8 @@ def get_container_kwargs(
     }
     user = f"{os.getuid()}:{os.getgid()}"
     kwargs = {
+        # Passing the workspace lets a warm pooled container run the job.
+        "repo_directory": repo_directory,
         "image": "aider-raaid",
         "entrypoint": entrypoint,
         "environment": env_vars,
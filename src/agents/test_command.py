@@ -0,0 +1,217 @@
+import configparser
+import hashlib
+import json
+import os
+import re
+import tomllib
+from typing import Callable, Optional
+
+from loguru import logger
+
+from src.config import SETTINGS
+
+from .prompt_cache import PromptCache
+
+README_FILES = ("README.md", "README.txt", "README.rst", "README")
+MANIFEST_FILES = (
+    "Makefile",
+    "pyproject.toml",
+    "setup.cfg",
+    "tox.ini",
+    "pytest.ini",
+    "package.json",
+    "Cargo.toml",
+    "go.mod",
+)
+_LOCK_FILES = {"yarn.lock": "yarn test", "pnpm-lock.yaml": "pnpm test"}
+_SKIPPED_DIRECTORIES = {
+    ".git",
+    ".hg",
+    ".tox",
+    ".venv",
+    "venv",
+    "env",
+    "node_modules",
+    "vendor",
+    "third_party",
+    "__pycache__",
+    "dist",
+    "build",
+    "target",
+    "site-packages",
+}
+_MAX_WALK_DEPTH = 4
+_MAKE_TEST_TARGET = re.compile(r"^(test|tests|check)\s*:", re.MULTILINE)
+_NPM_DEFAULT_TEST = "no test specified"
+
+_test_command_cache: Optional[PromptCache] = None
+
+
+def _get_test_command_cache() -> PromptCache:
+    global _test_command_cache
+    if _test_command_cache is None:
+        _test_command_cache = PromptCache(cache_dir=SETTINGS.test_command_cache_dir)
+    return _test_command_cache
+
+
+def _read_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def read_top_level_files(repo_path: str) -> dict[str, str]:
+    """Read the README and build manifests found at the top level of a repository."""
+    try:
+        entries = set(os.listdir(repo_path))
+    except OSError as e:
+        logger.error(f"Error listing repository {repo_path}: {e}")
+        return {}
+
+    files = {}
+    for name in (*README_FILES, *MANIFEST_FILES):
+        if name in entries:
+            content = _read_file(os.path.join(repo_path, name))
+            if content is not None:
+                files[name] = content
+    for name in _LOCK_FILES:
+        if name in entries:
+            files[name] = ""
+    return files
+
+
+def find_readme(repo_path: str) -> Optional[str]:
+    """Find a README below the top level, skipping dependency and build directories."""
+    base_depth = repo_path.rstrip(os.sep).count(os.sep)
+    for root, directories, files in os.walk(repo_path):
+        if root.count(os.sep) - base_depth >= _MAX_WALK_DEPTH:
+            directories[:] = []
+        else:
+            directories[:] = sorted(d for d in directories if d not in _SKIPPED_DIRECTORIES)
+
+        for name in README_FILES:
+            if name in files:
+                readme_path = os.path.join(root, name)
+                logger.info(f"README file found: {readme_path}")
+                return _read_file(readme_path)
+    return None
+
+
+def _python_test_command(files: dict[str, str]) -> Optional[str]:
+    if "pytest.ini" in files:
+        return "pytest"
+
+    if "pyproject.toml" in files:
+        try:
+            pyproject = tomllib.loads(files["pyproject.toml"])
+        except tomllib.TOMLDecodeError:
+            pyproject = {}
+        tool = pyproject.get("tool", {})
+        if "pytest" in tool:
+            return "pytest"
+        dependencies = json.dumps(
+            [
+                pyproject.get("project", {}).get("optional-dependencies", {}),
+                pyproject.get("dependency-groups", {}),
+                tool.get("poetry", {}).get("group", {}),
+                tool.get("poetry", {}).get("dev-dependencies", {}),
+            ]
+        )
+        if "pytest" in dependencies:
+            return "pytest"
+
+    for name, section in (("setup.cfg", "tool:pytest"), ("tox.ini", "pytest")):
+        if name not in files:
+            continue
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            parser.read_string(files[name])
+        except configparser.Error:
+            continue
+        if parser.has_section(section):
+            return "pytest"
+        if name == "tox.ini" and parser.has_section("tox"):
+            return "tox"
+    return None
+
+
+def _node_test_command(files: dict[str, str]) -> Optional[str]:
+    try:
+        package = json.loads(files["package.json"])
+    except (KeyError, json.JSONDecodeError):
+        return None
+
+    test_script = package.get("scripts", {}).get("test")
+    if not test_script or _NPM_DEFAULT_TEST in test_script:
+        return None
+
+    for lock_file, command in _LOCK_FILES.items():
+        if lock_file in files:
+            return command
+    return "npm test"
+
+
+def infer_test_command(files: dict[str, str]) -> Optional[str]:
+    """Infer the test command from build manifests, or return None if they do not say."""
+    if "Makefile" in files:
+        match = _MAKE_TEST_TARGET.search(files["Makefile"])
+        if match:
+            return f"make {match.group(1)}"
+
+    command = _python_test_command(files) or _node_test_command(files)
+    if command:
+        return command
+
+    if "Cargo.toml" in files:
+        return "cargo test"
+    if "go.mod" in files:
+        return "go test ./..."
+    return None
+
+
+def _git_config_path(repo_path: str) -> str:
+    git_path = os.path.join(repo_path, ".git")
+    if not os.path.isfile(git_path):
+        return os.path.join(git_path, "config")
+
+    # Worktrees have a `.git` file pointing at their git directory, whose config lives in
+    # the common directory of the repository they were added from.
+    git_file = _read_file(git_path) or ""
+    git_dir = os.path.join(repo_path, git_file.removeprefix("gitdir:").strip())
+    common_dir = (_read_file(os.path.join(git_dir, "commondir")) or ".").strip()
+    return os.path.join(git_dir, common_dir, "config")
+
+
+def _get_remote_url(repo_path: str) -> str:
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    try:
+        parser.read(_git_config_path(repo_path))
+        return parser.get('remote "origin"', "url", fallback="")
+    except configparser.Error:
+        return ""
+
+
+def _cache_key(repo_path: str, files: dict[str, str]) -> str:
+    """Key a repository by its remote and the content of its README and manifests."""
+    digest = hashlib.sha256(_get_remote_url(repo_path).encode())
+    for name in sorted(files):
+        digest.update(f"\0{name}\0{files[name]}".encode())
+    # Without a top-level README the command comes from a nested one, which must be part
+    # of the key, or repositories without a remote would share the same entry.
+    if not any(name in files for name in README_FILES):
+        digest.update(f"\0nested README\0{find_readme(repo_path) or ''}".encode())
+    return digest.hexdigest()
+
+
+def get_or_compute_test_command(
+    repo_path: str, files: dict[str, str], compute: Callable[[], str]
+) -> str:
+    """Return the cached test command of a repository, computing it on a miss."""
+    cache_key = _cache_key(repo_path, files)
+    # Stored as JSON so that "no test command" is cached too.
+    payload = _get_test_command_cache().get_or_compute(
+        cache_key, "test-command", lambda: json.dumps({"command": compute()})
+    )
+    return json.loads(payload)["command"] if payload else ""
@@ -1,4 +1,5 @@
 import os
+import threading
 
 from dotenv import load_dotenv
 from pydantic import Field, field_validator, model_validator
@@ -18,6 +19,17 @@ class Settings(BaseSettings):
     market_url: str = Field("https://api.agent.market", description="The URL for the market.")
     market_api_key: str = Field(..., description="The API key for the market.")
 
+    market_max_connections: int = Field(
+        20, gt=0, description="The maximum number of open connections to the market."
+    )
+    market_max_keepalive_connections: int = Field(
+        10, ge=0, description="The maximum number of idle connections kept open to the market."
+    )
+    market_keepalive_expiry: float = Field(
+        60.0, gt=0, description="Seconds an idle connection to the market is kept alive."
+    )
+    market_http2: bool = Field(True, description="Whether to use HTTP/2 for market requests.")
+
     market_open_instance_code: int = Field(
         0, description="The code for an open instance in the market."
     )
@@ -28,7 +40,159 @@ class Settings(BaseSettings):
         1, description="The code for an awarded proposal in the market."
     )
 
+    market_page_size: int | None = Field(
+        None,
+        gt=0,
+        description="The page size of market list requests, streamed unpaginated if unset.",
+    )
+    market_page_concurrency: int = Field(
+        4, gt=0, description="The number of market list pages fetched concurrently."
+    )
+    market_lists_newest_first: bool = Field(
+        False,
+        description="Whether market lists are ordered newest first, allowing reads to stop early.",
+    )
+    market_record_dir: str | None = Field(
+        None, description="The directory where market API traffic is recorded, if set."
+    )
+    market_replay_dir: str | None = Field(
+        None,
+        description="The directory of recorded market API traffic replayed instead of the market.",
+    )
+    market_replay_speed: float | None = Field(
+        None,
+        gt=0,
+        description="How many times faster than recorded replayed responses arrive, or no delay.",
+    )
+    market_scan_index_path: str = Field(
+        "/tmp/agent_market/seen_instances.json",
+        description="The path of the persistent index of instances already handled by the scan.",
+    )
+
+    scheduler_min_interval: float = Field(
+        1.0, gt=0, description="Seconds between cycles while there is work to do."
+    )
+    scheduler_base_interval: float = Field(
+        10.0, gt=0, description="Seconds before the first backoff step after an idle cycle."
+    )
+    scheduler_max_interval: float = Field(
+        300.0, gt=0, description="The maximum number of seconds between cycles."
+    )
+    scheduler_solve_max_interval: float = Field(
+        10.0,
+        gt=0,
+        description="The maximum number of seconds between solver cycles, bounding reply latency.",
+    )
+
+    container_pool_size: int = Field(
+        2, ge=0, description="The number of idle containers kept warm per image by each worker."
+    )
+    container_pool_max_uses: int = Field(
+        1, gt=0, description="The number of jobs a pooled container runs before it is replaced."
+    )
+    container_workspace_root: str = Field(
+        "/tmp/agent_workspaces",
+        description="The directory under which job workspaces can use pooled containers.",
+    )
+
+    git_mirror_cache_enabled: bool = Field(
+        True, description="Whether to clone repositories through a local bare-mirror cache."
+    )
+    git_mirror_cache_dir: str = Field(
+        "/tmp/agent_market/git_mirrors", description="The directory of the bare-mirror cache."
+    )
+    git_clone_depth: int | None = Field(
+        None, gt=0, description="The history depth of cloned workspaces, full history if unset."
+    )
+    git_clone_partial: bool = Field(
+        False, description="Whether to make blob-less partial clones fetching blobs on demand."
+    )
+
+    workspace_root: str = Field(
+        "/tmp/agent_workspaces/worktrees",
+        description="The directory holding the reusable git worktrees of jobs.",
+    )
+    workspace_quota_mb: int = Field(
+        10240, gt=0, description="The disk quota of the worktrees in megabytes."
+    )
+
+    llm_requests_per_minute: int = Field(
+        500, gt=0, description="The maximum number of LLM requests per minute of all processes."
+    )
+    llm_tokens_per_minute: int = Field(
+        200_000, gt=0, description="The maximum number of LLM tokens per minute of all processes."
+    )
+    llm_rate_limit_path: str = Field(
+        "/tmp/agent_market/llm_rate_limits.sqlite3",
+        description="The path of the LLM rate limit state shared by all processes.",
+    )
+    llm_max_concurrency_per_model: int = Field(
+        8, gt=0, description="The maximum number of concurrent LLM requests per model."
+    )
+    llm_max_retries: int = Field(
+        5, ge=0, description="The number of retries of rate-limited or failed LLM requests."
+    )
+
+    container_log_dir: str = Field(
+        "/tmp/agent_market/container_logs",
+        description="The directory where full container logs are saved compressed.",
+    )
+    container_log_retention_days: float = Field(
+        7, gt=0, description="The number of days saved container logs are kept."
+    )
+    container_log_max_chars: int = Field(
+        200_000, gt=0, description="The number of log characters kept in memory per container."
+    )
+    github_api_url: str = Field(
+        "https://api.github.com", description="The base URL of the GitHub REST and GraphQL API."
+    )
+    github_cache_dir: str = Field(
+        "/tmp/agent_market/github_cache",
+        description="The directory where fetched pull request context is cached.",
+    )
+    pr_diff_max_file_chars: int = Field(
+        20_000, gt=0, description="The maximum patch size kept per file of a local PR diff."
+    )
+    pr_diff_max_total_chars: int = Field(
+        200_000, gt=0, description="The maximum total patch size of a local PR diff."
+    )
+    pr_diff_cache_dir: str = Field(
+        "/tmp/aider_cache/pr_diffs",
+        description="The directory where the PR diffs computed from mirrors are cached.",
+    )
+    log_token_budget: int = Field(
+        8_000, gt=0, description="The token budget for container logs sent to the LLM."
+    )
+    test_command_cache_dir: str = Field(
+        "/tmp/aider_cache/test_commands",
+        description="The directory where the inferred test commands of repositories are cached.",
+    )
+    pr_metadata_cache_dir: str = Field(
+        "/tmp/aider_cache/pr_metadata",
+        description="The directory where generated pull request titles and bodies are cached.",
+    )
+
+    solve_ledger_path: str = Field(
+        "/tmp/agent_market/solve_ledger.sqlite3",
+        description="The path of the ledger of solved and delivered conversation states.",
+    )
+
+    metrics_port: int | None = Field(
+        None, gt=0, description="The port of the Prometheus metrics endpoint, disabled if unset."
+    )
+    metrics_host: str = Field("127.0.0.1", description="The address the metrics endpoint binds.")
+    metrics_dir: str = Field(
+        "/tmp/agent_market/metrics",
+        description="The directory where each process writes its metrics snapshot.",
+    )
+    metrics_flush_interval: float = Field(
+        5.0, gt=0, description="Seconds between the metrics snapshots written by each process."
+    )
+
     max_bid: float = Field(0.01, gt=0, description="The maximum bid for a proposal.")
+    solve_instances_max_concurrency: int = Field(
+        4, gt=0, description="The maximum number of awarded instances solved concurrently."
+    )
     agent_type: AgentType = Field(..., description="The type of agent to use.")
 
     anthropic_api_key: str | None = Field(None, description="The API key for Anthropic.")
@@ -57,4 +221,33 @@ class Settings(BaseSettings):
         return cls()
 
 
-SETTINGS = Settings.load_settings()
+class _LazySettings:
+    """Stand in for the settings until an attribute is first read.
+
+    Loading reads the environment and, on AWS, fetches secrets, so it is deferred until
+    the settings are used rather than done whenever a module imports them.
+    """
+
+    def __init__(self):
+        self._settings: Settings | None = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Settings:
+        if self._settings is None:
+            with self._lock:
+                if self._settings is None:
+                    self._settings = Settings.load_settings()
+        return self._settings
+
+    def __getattr__(self, name: str):
+        # Private names are never settings, and resolving them here would recurse while
+        # the proxy itself is being set up.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self) -> str:
+        return repr(self.load())
+
+
+SETTINGS: Settings = _LazySettings()  # type: ignore[assignment]
@@ -1,82 +1,507 @@
+import json
+import multiprocessing.util
+import os
 import re
+import shlex
+import socket
+import threading
 import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
 
-import openai
 from docker import from_env as docker_from_env
 from loguru import logger
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ReadTimeout
 
+from src import metrics
+from src.agents.open_hands import runtime_container_job_id, runtime_container_prefix
 from src.config import SETTINGS
+from src.utils.agent_market import remove_log_artifacts
+from src.utils.log_condenser import condense_logs
+from src.utils.log_stream import LogStream
+from src.utils.process_utils import is_process_alive
 
-openai.api_key = SETTINGS.openai_api_key
-WEAK_MODEL = "gpt-4o-mini"
+CONTAINER_OWNER_LABEL = "agent-market.owner"
+CONTAINER_JOB_LABEL = "agent-market.job-id"
+CONTAINER_HOST_LABEL = "agent-market.host"
+CONTAINER_PID_LABEL = "agent-market.pid"
+CONTAINER_POOL_LABEL = "agent-market.pool"
+_CONTAINER_OWNER = "minimal-provider-agent-market"
+
+_VENV_ACTIVATION = re.compile(r"source (\S+)/bin/activate && (.*)", re.DOTALL)
+_SHELL_OPERATOR_CHARS = set("();<>|&")
+_DEFAULT_PATH = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+
+_container_manager: Optional["ContainerManager"] = None
+_container_pool: Optional["WarmContainerPool"] = None
+_logs_pruned_at = 0.0
+_LOG_PRUNE_INTERVAL = 3600
+
+
+@dataclass
+class ContainerRunResult:
+    exit_code: Optional[int]
+    duration: float
+    logs: str
+    timed_out: bool = False
+    log_path: Optional[str] = None
 
 
 def _clean_logs(logs: str) -> str:
-    anti_escape_logs = re.compile(r"\x1B[@-_][0-?]*[ -/]*[@-~]")
-    logs = anti_escape_logs.sub("", logs).split("Tokens:")[0]
-    logs = logs.replace("Provider List:", "")
-
-    prompt = """
-    Below are the raw logs from an AI coding assistant. Please rewrite these logs as a clear, 
-    concise message to a user, focusing on the important actions and changes made. Remove any 
-    technical artifacts, ANSI escape codes, and redundant information. Format the response 
-    in a user-friendly way.
-
-    Raw logs:
-    {logs}
-    """
+    # The user-facing summary is written by the PR metadata call, so logs are only condensed
+    # here, without an LLM round trip of their own.
+    logs = remove_log_artifacts(logs)
+    try:
+        return condense_logs(logs, SETTINGS.log_token_budget)
+    except Exception as e:
+        logger.error(f"Failed to summarize oversized logs: {e}")
+        return condense_logs(logs, SETTINGS.log_token_budget, summarize=False)
+
+
+def _prune_container_logs() -> None:
+    """Delete saved container logs older than the retention period, at most once an hour."""
+    global _logs_pruned_at
+    now = time.time()
+    if now - _logs_pruned_at < _LOG_PRUNE_INTERVAL:
+        return
+    _logs_pruned_at = now
 
+    cutoff = now - SETTINGS.container_log_retention_days * 86400
+    removed = 0
     try:
-        response = openai.chat.completions.create(
-            model=WEAK_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that processes technical logs.",
-                },
-                {"role": "user", "content": prompt.format(logs=logs)},
-            ],
-        )
-        return response.choices[0].message.content.strip()
+        entries = list(os.scandir(SETTINGS.container_log_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not entry.name.endswith(".log.gz"):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} container logs older than the retention period")
+
 
+def _open_log_stream(job_id: str) -> LogStream:
+    _prune_container_logs()
+    return LogStream(
+        spill_path=os.path.join(SETTINGS.container_log_dir, f"{job_id}.log.gz"),
+        max_chars=SETTINGS.container_log_max_chars,
+    )
+
+
+def _consume_stream(stream, log_stream: LogStream, source: str) -> None:
+    try:
+        for chunk in stream:
+            text = log_stream.feed(chunk)
+            if text.strip():
+                logger.debug(f"{source}: {text.rstrip()}")
     except Exception as e:
-        logger.error(f"Failed to process logs with GPT-4: {e}")
-        return logs
+        logger.warning(f"Stopped streaming logs of {source}: {e}")
+
+
+def _stream_logs(container, log_stream: LogStream) -> None:
+    stream = container.logs(stream=True, follow=True)
+    _consume_stream(stream, log_stream, f"Container {container.short_id}")
+
+
+class ContainerManager:
+    def __init__(self, docker_client=None):
+        self.docker_client = docker_client or docker_from_env()
+        self._active_runs: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active_runs(self) -> list[str]:
+        """Return the job IDs of the containers currently run by this process."""
+        with self._lock:
+            return list(self._active_runs)
+
+    def run(self, job_id: str, **kwargs):
+        """Start a detached container labelled with the job ID and the owning process."""
+        labels = {
+            **kwargs.pop("labels", {}),
+            CONTAINER_OWNER_LABEL: _CONTAINER_OWNER,
+            CONTAINER_JOB_LABEL: job_id,
+            CONTAINER_HOST_LABEL: socket.gethostname(),
+            CONTAINER_PID_LABEL: str(os.getpid()),
+        }
+        container = self.docker_client.containers.run(**kwargs, labels=labels, detach=True)
+        with self._lock:
+            self._active_runs[job_id] = container
+        logger.info(f"Container {container.short_id} launched for job {job_id}")
+        return container
+
+    def cleanup(self, job_id: str) -> None:
+        """Stop and remove the containers of a single job."""
+        with self._lock:
+            self._active_runs.pop(job_id, None)
+
+        containers = self.docker_client.containers.list(
+            all=True,
+            filters={
+                "label": [
+                    f"{CONTAINER_OWNER_LABEL}={_CONTAINER_OWNER}",
+                    f"{CONTAINER_JOB_LABEL}={job_id}",
+                ]
+            },
+        )
+        # OpenHands starts its sandbox itself, so it has none of our labels.
+        containers += self._sandboxes(job_id)
+        for container in containers:
+            self._remove(container)
+        logger.info(f"Removed {len(containers)} containers for job {job_id}")
+
+    def _sandboxes(self, job_id: Optional[str] = None) -> list:
+        prefix = runtime_container_prefix(job_id)
+        containers = self.docker_client.containers.list(all=True, filters={"name": prefix})
+        # The name filter also matches in the middle of names.
+        return [container for container in containers if container.name.startswith(prefix)]
+
+    def reap_orphans(self) -> int:
+        """Remove containers left behind by processes of this host that no longer exist."""
+        containers = self.docker_client.containers.list(
+            all=True, filters={"label": f"{CONTAINER_OWNER_LABEL}={_CONTAINER_OWNER}"}
+        )
+        hostname = socket.gethostname()
+        reaped = 0
+        live_jobs = set()
+        for container in containers:
+            labels = container.labels or {}
+            if labels.get(CONTAINER_HOST_LABEL) != hostname or is_process_alive(
+                int(labels.get(CONTAINER_PID_LABEL, 0))
+            ):
+                live_jobs.add(labels.get(CONTAINER_JOB_LABEL))
+                continue
+
+            logger.info(
+                f"Reaping orphaned container {container.short_id} "
+                f"of job {labels.get(CONTAINER_JOB_LABEL)}"
+            )
+            self._remove(container)
+            reaped += 1
+
+        # A sandbox outlives its job when the agent container is gone.
+        for container in self._sandboxes():
+            if runtime_container_job_id(container.name) in live_jobs:
+                continue
+            logger.info(f"Reaping orphaned sandbox container {container.name}")
+            self._remove(container)
+            reaped += 1
+        return reaped
+
+    @staticmethod
+    def _remove(container) -> None:
+        try:
+            container.stop()
+            container.remove()
+        except Exception as e:
+            logger.warning(f"Failed to remove container {container.short_id}: {e}")
+
+
+def get_container_manager() -> ContainerManager:
+    global _container_manager
+    if _container_manager is None:
+        _container_manager = ContainerManager()
+        reaped = _container_manager.reap_orphans()
+        if reaped:
+            logger.info(f"Reaped {reaped} orphaned containers")
+    return _container_manager
+
+
+def _image_path(container) -> str:
+    for variable in (container.attrs or {}).get("Config", {}).get("Env") or []:
+        if variable.startswith("PATH="):
+            return variable[len("PATH=") :]
+    return _DEFAULT_PATH
+
+
+def _exec_command(command, environment: Optional[dict], container) -> tuple:
+    """Run a `source <venv>/bin/activate && ...` shell command directly inside the venv.
+
+    Activating only puts the venv first on the PATH, which the exec environment does
+    without starting a shell.
+    """
+    if not isinstance(command, list) or command[:2] != ["/bin/bash", "-c"] or len(command) != 3:
+        return command, environment
+    match = _VENV_ACTIVATION.fullmatch(command[2])
+    if match is None:
+        return command, environment
+
+    venv, rest = match.groups()
+    lexer = shlex.shlex(rest, posix=True, punctuation_chars=True)
+    if any(token and set(token) <= _SHELL_OPERATOR_CHARS for token in lexer):
+        # Pipes, redirections and command lists still need the shell.
+        command = ["/bin/bash", "-c", rest]
+    else:
+        command = shlex.split(rest)
 
+    environment = dict(environment or {})
+    path = environment.get("PATH") or _image_path(container)
+    environment.update(VIRTUAL_ENV=venv, PATH=f"{venv}/bin:{path}")
+    return command, environment
 
+
+@dataclass
+class _PooledContainer:
+    container: object
+    job_id: str
+    uses: int = 0
+
+
+class WarmContainerPool:
+    """Idle agent containers per image, kept by a single process."""
+
+    def __init__(
+        self,
+        manager: ContainerManager,
+        size: int,
+        workspace_root: str,
+        max_uses: int = 1,
+    ):
+        self.manager = manager
+        self.size = size
+        self.workspace_root = os.path.normpath(workspace_root)
+        self.max_uses = max_uses
+        self._idle: dict[str, deque[_PooledContainer]] = {}
+        self._starting: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def supports(self, repo_directory: Optional[str], kwargs: dict) -> bool:
+        """Check if a job can be dispatched into a pooled container."""
+        if self.size <= 0 or not repo_directory or "name" in kwargs:
+            return False
+
+        repo_directory = os.path.normpath(repo_directory)
+        return os.path.commonpath([repo_directory, self.workspace_root]) == self.workspace_root
+
+    def _template(self, repo_directory: str, kwargs: dict) -> tuple[str, dict]:
+        # Pooled containers mount the whole workspace root at the same path, so any
+        # job workspace under it can be used as the working directory of an exec.
+        volumes = {
+            host_path: bind
+            for host_path, bind in kwargs.get("volumes", {}).items()
+            if os.path.normpath(host_path) != os.path.normpath(repo_directory)
+        }
+        volumes[self.workspace_root] = {"bind": self.workspace_root, "mode": "rw"}
+        template = {
+            "image": kwargs["image"],
+            "entrypoint": ["sleep", "infinity"],
+            "volumes": volumes,
+            "tty": True,
+        }
+        for key in ("user", "extra_hosts"):
+            if kwargs.get(key):
+                template[key] = kwargs[key]
+        return json.dumps(template, sort_keys=True), template
+
+    def _start(self, template: dict) -> _PooledContainer:
+        job_id = f"pool-{uuid.uuid4().hex}"
+        container = self.manager.run(
+            job_id, **template, labels={CONTAINER_POOL_LABEL: template["image"]}
+        )
+        return _PooledContainer(container=container, job_id=job_id)
+
+    def _replenish(self, key: str, template: dict) -> None:
+        with self._lock:
+            missing = self.size - len(self._idle.setdefault(key, deque()))
+            missing -= self._starting.get(key, 0)
+            if missing <= 0 or self._closed:
+                return
+            self._starting[key] = self._starting.get(key, 0) + missing
+
+        for _ in range(missing):
+            try:
+                pooled = self._start(template)
+                with self._lock:
+                    closed = self._closed
+                    if not closed:
+                        self._idle[key].append(pooled)
+                if closed:
+                    self.manager.cleanup(pooled.job_id)
+            except Exception as e:
+                logger.error(f"Failed to start pooled container for {template['image']}: {e}")
+            finally:
+                with self._lock:
+                    self._starting[key] -= 1
+
+    def _replenish_in_background(self, key: str, template: dict) -> None:
+        threading.Thread(target=self._replenish, args=(key, template), daemon=True).start()
+
+    def _acquire(self, key: str, template: dict) -> _PooledContainer:
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            pooled = idle.popleft() if idle else None
+
+        if pooled is None:
+            logger.info(f"No idle container for {template['image']}, starting one")
+            pooled = self._start(template)
+        self._replenish_in_background(key, template)
+        return pooled
+
+    def _release(self, key: str, template: dict, pooled: _PooledContainer, healthy: bool) -> None:
+        pooled.uses += 1
+        with self._lock:
+            if healthy and pooled.uses < self.max_uses and not self._closed:
+                self._idle[key].append(pooled)
+                return
+
+        self.manager.cleanup(pooled.job_id)
+        self._replenish_in_background(key, template)
+
+    def close(self) -> None:
+        """Remove the idle containers now, and the busy ones once their job finishes."""
+        with self._lock:
+            self._closed = True
+            idle = [pooled for containers in self._idle.values() for pooled in containers]
+            self._idle.clear()
+        for pooled in idle:
+            self.manager.cleanup(pooled.job_id)
+        if idle:
+            logger.info(f"Removed {len(idle)} idle pooled containers")
+
+    def run(self, job_id: str, repo_directory: str, timeout: int, **kwargs) -> ContainerRunResult:
+        """Run the agent command of a job inside a warm container."""
+        key, template = self._template(repo_directory, kwargs)
+        pooled = self._acquire(key, template)
+        container = pooled.container
+        logger.info(f"Dispatching job into pooled container {container.short_id}")
+
+        log_stream = None
+        try:
+            command, environment = _exec_command(
+                kwargs.get("entrypoint") or kwargs.get("command"),
+                kwargs.get("environment"),
+                container,
+            )
+            api = self.manager.docker_client.api
+            exec_id = api.exec_create(
+                container.id,
+                command,
+                environment=environment,
+                workdir=os.path.normpath(repo_directory),
+                user=kwargs.get("user", ""),
+                tty=True,
+            )["Id"]
+            started_at = time.monotonic()
+
+            log_stream = _open_log_stream(job_id)
+            log_thread = threading.Thread(
+                target=_consume_stream,
+                args=(api.exec_start(exec_id, stream=True), log_stream, f"Exec {exec_id[:12]}"),
+                daemon=True,
+            )
+            log_thread.start()
+            log_thread.join(timeout)
+
+            timed_out = log_thread.is_alive()
+            duration = time.monotonic() - started_at
+            if timed_out:
+                logger.warning(f"Job did not finish within {timeout} seconds. Recycling container.")
+                exit_code = None
+            else:
+                exit_code = api.exec_inspect(exec_id).get("ExitCode")
+                logger.info(f"Job exited with status {exit_code}")
+        except BaseException:
+            # A container whose exec failed to run is removed rather than returned to the pool.
+            self._release(key, template, pooled, healthy=False)
+            if log_stream is not None:
+                log_stream.close()
+            raise
+
+        # Removing a timed out container also terminates its exec and the log stream.
+        self._release(key, template, pooled, healthy=not timed_out)
+        log_thread.join(timeout=10)
+        log_stream.close()
+
+        logs = _clean_logs(log_stream.text())
+        logger.info(f"Clean logs: {logs}")
+        return ContainerRunResult(
+            exit_code=exit_code,
+            duration=duration,
+            logs=logs,
+            timed_out=timed_out,
+            log_path=str(log_stream.spill_path),
+        )
+
+
+def get_container_pool() -> WarmContainerPool:
+    global _container_pool
+    if _container_pool is None:
+        _container_pool = WarmContainerPool(
+            get_container_manager(),
+            size=SETTINGS.container_pool_size,
+            workspace_root=SETTINGS.container_workspace_root,
+            max_uses=SETTINGS.container_pool_max_uses,
+        )
+        # Each solver worker keeps its own pool. Workers exit without running atexit
+        # hooks but do run these finalizers, as does the main process.
+        multiprocessing.util.Finalize(None, _container_pool.close, exitpriority=10)
+    return _container_pool
+
+
+@metrics.timed("agent_runtime_duration_seconds", runtime="container")
 def launch_container_with_repo_mounted(
     timeout: int = 300,
+    job_id: Optional[str] = None,
+    repo_directory: Optional[str] = None,
     **kwargs,
-) -> str:
-    docker_client = docker_from_env()
-    logger.info("Launching container")
-    container = docker_client.containers.run(
+) -> ContainerRunResult:
+    job_id = job_id or uuid.uuid4().hex
+    pool = get_container_pool()
+    if pool.supports(repo_directory, kwargs):
+        return pool.run(job_id, repo_directory, timeout, **kwargs)
+
+    manager = get_container_manager()
+    logger.info(f"Launching container for job {job_id}")
+    container = manager.run(
+        job_id,
         **kwargs,
         tty=True,
         stdin_open=True,
-        detach=True,
     )
-    logger.info("Container launched")
+    started_at = time.monotonic()
 
-    try:
-        time.sleep(timeout)
-        logger.info("Timeout reached. Examining logs.")
-        raw_logs = container.logs(stream=False).decode("utf-8")
-        logger.info(f"Raw logs: {raw_logs}")
-        logs = _clean_logs(raw_logs)
-        logger.info(f"Clean logs: {logs}")
+    log_stream = _open_log_stream(job_id)
+    log_thread = threading.Thread(target=_stream_logs, args=(container, log_stream), daemon=True)
+    log_thread.start()
 
-        logger.info("Removing all containers")
-        for container in docker_client.containers.list(all=True):
+    try:
+        timed_out = False
+        try:
+            status = container.wait(timeout=timeout)
+            exit_code = status.get("StatusCode")
+            logger.info(f"Container exited with status {exit_code}")
+        except (ReadTimeout, RequestsConnectionError):
+            logger.warning(f"Container did not finish within {timeout} seconds. Stopping it.")
+            timed_out = True
+            exit_code = None
             container.stop()
-            container.remove()
-        logger.info("Containers removed")
+
+        duration = time.monotonic() - started_at
+        log_thread.join(timeout=10)
+        log_stream.close()
+        logs = _clean_logs(log_stream.text())
+        logger.info(f"Clean logs: {logs}")
 
     except Exception as e:
         logger.error(f"Failed to wait for container: {e}")
-        for container in docker_client.containers.list(all=True):
-            container.stop()
-            container.remove()
         raise
 
-    return logs
+    finally:
+        manager.cleanup(job_id)
+
+    return ContainerRunResult(
+        exit_code=exit_code,
+        duration=duration,
+        logs=logs,
+        timed_out=timed_out,
+        log_path=str(log_stream.spill_path),
+    )
@@ -9,3 +9,24 @@ class AgentType(str, Enum):
     open_hands = "open-hands"
     aider = "aider"
     raaid = "raaid"
+
+
+class SolveOutcome(str, Enum):
+    skipped = "skipped"
+    no_response = "no-response"
+    delivered = "delivered"
+    delivery_failed = "delivery-failed"
+    failed = "failed"
+
+
+class SolveStatus(str, Enum):
+    pending = "pending"
+    claimed = "claimed"
+    solved = "solved"
+    delivered = "delivered"
+    no_response = "no-response"
+
+
+class InstanceDecision(str, Enum):
+    proposed = "proposed"
+    ineligible = "ineligible"
@@ -1,71 +1,154 @@
 import asyncio
+from typing import Callable, Optional
 
 import httpx
 from loguru import logger
 
 from src import utils
 from src.config import SETTINGS, Settings
+from src.enums import InstanceDecision
+from src.utils.instance_index import SeenInstanceIndex
+from src.utils.market_client import get_async_market_client
+from src.utils.market_listing import MarketListReader
 
-TIMEOUT = httpx.Timeout(10.0)
+_runner: Optional[asyncio.Runner] = None
+_index: Optional[SeenInstanceIndex] = None
+# The awarded proposals seen by the last scan, so only new awards wake the solver.
+_known_awards: set[str] = set()
 
 
-async def _create_proposal_for_instance(instance: dict, settings: Settings) -> None:
+def _get_index(settings: Settings) -> SeenInstanceIndex:
+    global _index
+    if _index is None:
+        _index = SeenInstanceIndex(settings.market_scan_index_path)
+    return _index
+
+
+def _store_validators(index: SeenInstanceIndex, response: Optional[httpx.Response]) -> None:
+    # Paginated listings are never fetched conditionally, so they have no validators.
+    if response is None:
+        return
+    index.store_validators(
+        str(response.request.url),
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+    )
+
+
+async def _create_proposal_for_instance(instance: dict, settings: Settings) -> InstanceDecision:
     instance_id = instance["id"]
     if utils.find_github_repo_url(instance["background"]):
         logger.info("Instance id {} have a github repo url", instance_id)
-        return
+        return InstanceDecision.ineligible
 
     logger.info("Creating proposal for instance id: {}", instance_id)
 
-    headers = {
-        "x-api-key": settings.market_api_key,
-        "Accept": "application/json",
-    }
-    url = f"{settings.market_url}/v1/proposals/create/for-instance/{instance_id}"
+    client = get_async_market_client(settings)
+    url = f"/v1/proposals/create/for-instance/{instance_id}"
     data = {
         "max_bid": settings.max_bid,
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, headers=headers, json=data)
+    response = await client.post(url, json=data)
 
     response.raise_for_status()
     logger.info(f"Proposal for instance id {instance_id} created successfully")
-
-
-async def async_market_scan_handler() -> None:
-    headers = {
-        "x-api-key": SETTINGS.market_api_key,
-        "Accept": "application/json",
-    }
-    url = f"{SETTINGS.market_url}/v1/instances/"
+    return InstanceDecision.proposed
+
+
+async def _scan_proposals(
+    client: httpx.AsyncClient,
+    candidate_ids: set[str],
+    on_award: Optional[Callable[[], None]],
+) -> set[str]:
+    """Return the candidates that already have a proposal, and report new awards."""
+    global _known_awards
+    filled_instances = set()
+    awards = set()
+    async for proposal in MarketListReader(client, "/v1/proposals/", settings=SETTINGS):
+        if proposal["instance_id"] in candidate_ids:
+            filled_instances.add(proposal["instance_id"])
+        if proposal.get("status") == SETTINGS.market_awarded_proposal_code:
+            awards.add(proposal["id"])
+
+    new_awards = awards - _known_awards
+    _known_awards = awards
+    if new_awards and on_award is not None:
+        logger.debug(f"Found {len(new_awards)} new awarded proposals")
+        on_award()
+    return filled_instances
+
+
+async def async_market_scan_handler(on_award: Optional[Callable[[], None]] = None) -> int:
+    client = get_async_market_client(SETTINGS)
+    index = _get_index(SETTINGS)
+
+    url = "/v1/instances/"
     params = {"instance_status": SETTINGS.market_open_instance_code}
-
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        response = await client.get(url, headers=headers, params=params)
-
-    response.raise_for_status()
-    open_instances = response.json()
-
-    if not open_instances:
+    listing = MarketListReader(client, url, params, SETTINGS, index=index)
+    open_instance_ids = set()
+    candidates = []
+    async for instance in listing:
+        open_instance_ids.add(instance["id"])
+        if not index.is_current(instance):
+            candidates.append(instance)
+
+    if listing.not_modified:
+        logger.debug("Open instances unchanged since last scan")
+        return 0
+
+    index.retain(open_instance_ids)
+
+    # An award takes its instance off the open listing, so every changed listing is a
+    # chance that one of our proposals was awarded.
+    candidate_ids = {instance["id"] for instance in candidates}
+    filled_instances = set()
+    if candidates or on_award is not None:
+        filled_instances = await _scan_proposals(client, candidate_ids, on_award)
+
+    if not open_instance_ids:
         logger.debug("No open instances found")
-        return
-
-    logger.debug(f"Found {len(open_instances)} open instances")
-    url = f"{SETTINGS.market_url}/v1/proposals/"
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        response = await client.get(url, headers=headers)
-
-    response.raise_for_status()
-    proposals = response.json()
-
-    filled_instances = set(proposal["instance_id"] for proposal in proposals)
-    tasks = [
-        _create_proposal_for_instance(instance, SETTINGS)
-        for instance in open_instances
-        if instance["id"] not in filled_instances
-    ]
-    await asyncio.gather(*tasks)
-
-
-def market_scan_handler() -> None:
-    asyncio.run(async_market_scan_handler())
+        _store_validators(index, listing.response)
+        index.save()
+        return 0
+
+    logger.debug(f"Found {len(open_instance_ids)} open instances, {len(candidates)} new or changed")
+
+    proposals_created = 0
+    failed = False
+    if candidates:
+        pending = []
+        for instance in candidates:
+            if instance["id"] in filled_instances:
+                index.record(instance, InstanceDecision.proposed)
+            else:
+                pending.append(instance)
+
+        results = await asyncio.gather(
+            *[_create_proposal_for_instance(instance, SETTINGS) for instance in pending],
+            return_exceptions=True,
+        )
+        for instance, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to create proposal for instance {instance['id']}: {result}")
+                failed = True
+                continue
+
+            index.record(instance, result)
+            if result == InstanceDecision.proposed:
+                proposals_created += 1
+
+    # Failed instances must be retried, so the listing cannot be treated as unchanged yet.
+    if not failed:
+        _store_validators(index, listing.response)
+    index.save()
+    return proposals_created
+
+
+def market_scan_handler(on_award: Optional[Callable[[], None]] = None) -> int:
+    """Bid on new open instances, calling `on_award` when one of our proposals was awarded."""
+    global _runner
+    # Reusing one event loop keeps the pooled async client and its connections alive
+    # between scans.
+    if _runner is None:
+        _runner = asyncio.Runner()
+    return _runner.run(async_market_scan_handler(on_award))
@@ -0,0 +1,278 @@
+import atexit
+import json
+import math
+import multiprocessing.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, Optional
+
+from loguru import logger
+
+from src.config import SETTINGS
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricsRegistry:
+    """Counters, gauges and latency histograms of a single process."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._gauges: dict[tuple[str, Labels], float] = {}
+        # Per bucket counts (not cumulative), then the sum and count of observations.
+        self._histograms: dict[tuple[str, Labels], list] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = next(
+                (i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets)
+            )
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "buckets": list(self.buckets),
+                "counters": [
+                    [name, dict(labels), v] for (name, labels), v in self._counters.items()
+                ],
+                "gauges": [[name, dict(labels), v] for (name, labels), v in self._gauges.items()],
+                "histograms": [
+                    [name, dict(labels), list(counts), total, count]
+                    for (name, labels), (counts, total, count) in self._histograms.items()
+                ],
+            }
+
+
+def merge_snapshots(snapshots: list[dict]) -> MetricsRegistry:
+    """Add up the snapshots of several processes.
+
+    Counters and histograms of exited processes still count towards the totals, while
+    gauges describe the present, so only those of running processes are kept.
+    """
+    # Imported here: src.utils imports this module while it initializes.
+    from src.utils.process_utils import is_process_alive
+
+    merged = MetricsRegistry()
+    for snapshot in snapshots:
+        if tuple(snapshot["buckets"]) != merged.buckets:
+            logger.warning(f"Skipping metrics of process {snapshot['pid']} with other buckets")
+            continue
+        for name, labels, value in snapshot["counters"]:
+            merged.inc(name, value, **labels)
+        if is_process_alive(snapshot["pid"]):
+            for name, labels, value in snapshot["gauges"]:
+                key = (name, _labels(labels))
+                merged._gauges[key] = merged._gauges.get(key, 0.0) + value
+        for name, labels, counts, total, count in snapshot["histograms"]:
+            key = (name, _labels(labels))
+            histogram = merged._histograms.setdefault(
+                key, [[0] * (len(merged.buckets) + 1), 0.0, 0]
+            )
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
+            histogram[2] += count
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render_prometheus(registry: MetricsRegistry) -> str:
+    """Render a registry in the Prometheus text exposition format."""
+    lines = []
+    snapshot = registry.snapshot()
+    for kind, entries in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+        for name in sorted({entry[0] for entry in entries}):
+            lines.append(f"# TYPE {name} {kind}")
+            for entry_name, labels, value in sorted(entries, key=lambda e: str(e[:2])):
+                if entry_name == name:
+                    lines.append(f"{name}{_format_labels(_labels(labels))} {_format_value(value)}")
+
+    histograms = snapshot["histograms"]
+    bounds = [*registry.buckets, math.inf]
+    for name in sorted({entry[0] for entry in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for entry_name, labels, counts, total, count in sorted(
+            histograms, key=lambda e: str(e[:2])
+        ):
+            if entry_name != name:
+                continue
+            labels = _labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_pid: Optional[int] = None
+_registry_lock = threading.Lock()
+# The directory snapshots are written to, once the flush thread found metrics enabled.
+_snapshot_dir: Optional[str] = None
+
+
+def flush() -> None:
+    """Write the snapshot of this process, where the metrics endpoint picks it up."""
+    if _registry is None or _registry_pid != os.getpid() or _snapshot_dir is None:
+        return
+    path = Path(_snapshot_dir) / f"{os.getpid()}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix(".tmp")
+    temporary_path.write_text(json.dumps(_registry.snapshot()))
+    os.replace(temporary_path, path)
+
+
+def _flush_periodically() -> None:
+    global _snapshot_dir
+    # Settings are read here rather than when recording, so code that records metrics
+    # never fails on missing settings.
+    try:
+        if not SETTINGS.metrics_port:
+            return
+        interval = SETTINGS.metrics_flush_interval
+        _snapshot_dir = SETTINGS.metrics_dir
+    except Exception as e:
+        logger.debug(f"Metrics snapshots disabled: {e}")
+        return
+
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception as e:
+            logger.warning(f"Failed to write metrics snapshot: {e}")
+
+
+def get_registry() -> MetricsRegistry:
+    global _registry, _registry_pid, _snapshot_dir
+    with _registry_lock:
+        # A forked process starts from zero, since the parent still reports its own counts,
+        # and needs its own flush thread since threads do not survive fork.
+        if _registry is None or _registry_pid != os.getpid():
+            _registry = MetricsRegistry()
+            _registry_pid = os.getpid()
+            _snapshot_dir = None
+            threading.Thread(target=_flush_periodically, daemon=True).start()
+            # Processes started by multiprocessing, such as solver workers, exit without
+            # running atexit hooks but do run these finalizers.
+            multiprocessing.util.Finalize(None, flush, exitpriority=10)
+    return _registry
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    get_registry().inc(name, amount, **labels)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    get_registry().set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    get_registry().observe(name, value, **labels)
+
+
+@contextmanager
+def timed(name: str, **labels) -> Iterator[None]:
+    """Observe the duration of a block or function, labelled with whether it raised."""
+    started_at = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        observe(name, time.perf_counter() - started_at, outcome=outcome, **labels)
+
+
+def reset_snapshots(metrics_dir: str) -> None:
+    """Remove the snapshots of a previous run, whose counts would add up with the new ones."""
+    for path in Path(metrics_dir).glob("*.json"):
+        path.unlink(missing_ok=True)
+
+
+def collect(metrics_dir: str) -> MetricsRegistry:
+    """Merge the snapshots of all processes with the live metrics of this one."""
+    snapshots = []
+    for path in Path(metrics_dir).glob("*.json"):
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to read metrics snapshot {path}: {e}")
+    if _registry is not None and _registry_pid == os.getpid():
+        snapshots = [s for s in snapshots if s["pid"] != os.getpid()]
+        snapshots.append(_registry.snapshot())
+    return merge_snapshots(snapshots)
+
+
+def serve_metrics(host: str, port: int, metrics_dir: str) -> ThreadingHTTPServer:
+    """Serve the metrics of all processes at /metrics from a background thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(collect(metrics_dir)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+    return server
+
+
+atexit.register(flush)
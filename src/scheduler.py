@@ -0,0 +1,74 @@
+import random
+import time
+from multiprocessing.synchronize import Event
+from typing import Callable, Optional
+
+from loguru import logger
+
+
+class AdaptiveScheduler:
+    def __init__(
+        self,
+        name: str,
+        min_interval: float,
+        base_interval: float,
+        max_interval: float,
+        jitter: float = 0.2,
+        wake_event: Optional[Event] = None,
+    ):
+        self.name = name
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.wake_event = wake_event
+        self._idle_streak = 0
+        self._error_streak = 0
+
+    def next_interval(self, found_work: bool, errored: bool = False) -> float:
+        """Compute the delay before the next cycle from the outcome of the last one."""
+        if errored:
+            self._error_streak += 1
+            self._idle_streak = 0
+            interval = self.base_interval * 2**self._error_streak
+        elif found_work:
+            self._error_streak = 0
+            self._idle_streak = 0
+            return self.min_interval
+        else:
+            self._error_streak = 0
+            interval = self.base_interval * 2**self._idle_streak
+            self._idle_streak += 1
+
+        interval = min(interval, self.max_interval)
+        interval *= random.uniform(1 - self.jitter, 1)
+        return max(interval, self.min_interval)
+
+    def wait(self, interval: float) -> bool:
+        """Sleep for the interval, returning early with True if woken up."""
+        if self.wake_event is None:
+            time.sleep(interval)
+            return False
+
+        woken = self.wake_event.wait(interval)
+        if woken:
+            self.wake_event.clear()
+        return woken
+
+    def run_forever(self, handler: Callable[[], bool]) -> None:
+        """Run the handler repeatedly, where the handler reports whether it found work."""
+        while True:
+            errored = False
+            found_work = False
+            try:
+                logger.info(f"Starting {self.name}")
+                found_work = bool(handler())
+                logger.info(f"{self.name} completed successfully")
+            except Exception as e:
+                errored = True
+                logger.info(f"{self.name} iteration skipped: {e}")
+
+            interval = self.next_interval(found_work, errored)
+            logger.info(f"Waiting {interval:.1f} seconds before next {self.name}...")
+            if self.wait(interval):
+                logger.info(f"{self.name} woken up early")
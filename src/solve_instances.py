@@ -1,74 +1,161 @@
-from dataclasses import dataclass
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Optional
 
 import httpx
-import openai
 from loguru import logger
 
-from src.agents.aider_modify_repo import modify_repo_with_aider
+from src import metrics
 from src.config import SETTINGS, Settings
-from src.enums import ModelName
+from src.enums import ModelName, SolveOutcome
+from src.utils.llm_client import chat_completion
+from src.utils.market_client import get_async_market_client, get_market_client
+from src.utils.market_listing import MarketListReader
+from src.utils.solve_ledger import conversation_state_hash, get_solve_ledger
 
 TIMEOUT = httpx.Timeout(10.0)
 
-openai.api_key = SETTINGS.openai_api_key
 WEAK_MODEL = "gpt-4o-mini"
 
+_executor: Optional[ProcessPoolExecutor] = None
+_runner: Optional[asyncio.Runner] = None
+
 
 @dataclass
 class InstanceToSolve:
     instance: dict
     messages_history: Optional[str] = None
     provider_needs_response: bool = False
+    state_hash: Optional[str] = None
 
 
-def _get_instance_to_solve(instance_id: str, settings: Settings) -> Optional[InstanceToSolve]:
-    try:
-        headers = {
-            "x-api-key": settings.market_api_key,
-        }
-        with httpx.Client(timeout=TIMEOUT) as client:
-            instance_endpoint = f"{settings.market_url}/v1/instances/{instance_id}"
-            response = client.get(instance_endpoint, headers=headers)
-            instance = response.json()
-
-            if (
-                not instance.get("status")
-                or instance["status"] != settings.market_resolved_instance_code
-            ):
-                return None
-
-        with httpx.Client(timeout=TIMEOUT) as client:
-            chat_endpoint = f"{settings.market_url}/v1/chat/{instance_id}"
-            response = client.get(chat_endpoint, headers=headers)
-
-            chat = response.json()
-            if isinstance(chat, dict) and chat.get("detail"):
-                return None
-
-            if not chat:
-                return InstanceToSolve(instance=instance)
-
-            sorted_messages = sorted(chat, key=lambda m: m["timestamp"])
-            last_message = sorted_messages[-1]
-            provider_needs_response = (
-                last_message["sender"] == "provider" and len(sorted_messages) < 20
-            )
+@dataclass
+class ChatState:
+    last_timestamp: Optional[str] = None
+    last_sender: Optional[str] = None
+    last_message_hash: Optional[str] = None
+    message_count: int = 0
+    messages_history: Optional[str] = None
+    etag: Optional[str] = None
+    handled_timestamp: Optional[str] = None
 
-            messages_history = "\n\n".join(
-                [f"{message['sender']}: {message['message']}" for message in sorted_messages]
-            )
 
-            return InstanceToSolve(
-                instance=instance,
-                messages_history=messages_history,
-                provider_needs_response=provider_needs_response,
-            )
-    except Exception:
+_chat_states: dict[str, ChatState] = {}
+
+
+@dataclass
+class SolveCycleReport:
+    awarded: int = 0
+    outcomes: dict[SolveOutcome, int] = field(default_factory=dict)
+    duration: float = 0.0
+
+    def record(self, outcome: SolveOutcome) -> None:
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def summary(self) -> str:
+        counts = ", ".join(
+            f"{outcome.value}={self.outcomes.get(outcome, 0)}" for outcome in SolveOutcome
+        )
+        return f"awarded={self.awarded}, {counts}, duration={self.duration:.1f}s"
+
+
+def _update_chat_state(state: ChatState, chat: list[dict]) -> ChatState:
+    """Append the messages newer than the cached ones to the conversation history."""
+    new_messages = sorted(
+        (
+            message
+            for message in chat
+            if state.last_timestamp is None or message["timestamp"] > state.last_timestamp
+        ),
+        key=lambda m: m["timestamp"],
+    )
+    if state.message_count + len(new_messages) != len(chat):
+        # Messages were removed or arrived out of order, so rebuild the history.
+        state = ChatState(handled_timestamp=state.handled_timestamp)
+        new_messages = sorted(chat, key=lambda m: m["timestamp"])
+
+    if not new_messages:
+        return state
+
+    new_history = "\n\n".join(
+        [f"{message['sender']}: {message['message']}" for message in new_messages]
+    )
+    if state.messages_history:
+        state.messages_history = f"{state.messages_history}\n\n{new_history}"
+    else:
+        state.messages_history = new_history
+    state.message_count += len(new_messages)
+    state.last_timestamp = new_messages[-1]["timestamp"]
+    state.last_sender = new_messages[-1]["sender"]
+    state.last_message_hash = conversation_state_hash(new_messages[-1])
+    return state
+
+
+async def _get_instance_to_solve(
+    client: httpx.AsyncClient, instance_id: str, settings: Settings
+) -> Optional[InstanceToSolve]:
+    state = _chat_states.setdefault(instance_id, ChatState())
+    chat_headers = {"If-None-Match": state.etag} if state.etag else {}
+    instance_response, chat_response = await asyncio.gather(
+        client.get(f"/v1/instances/{instance_id}"),
+        client.get(f"/v1/chat/{instance_id}", headers=chat_headers),
+    )
+    instance = instance_response.json()
+
+    if not instance.get("status") or instance["status"] != settings.market_resolved_instance_code:
         return None
 
+    if chat_response.status_code != httpx.codes.NOT_MODIFIED:
+        chat = chat_response.json()
+        if isinstance(chat, dict) and chat.get("detail"):
+            return None
+        state = _chat_states[instance_id] = _update_chat_state(state, chat)
+        state.etag = chat_response.headers.get("ETag")
+
+    if state.last_timestamp is not None and state.last_timestamp == state.handled_timestamp:
+        logger.debug(f"Conversation of instance {instance_id} unchanged since it was handled")
+        return None
+
+    if not state.message_count:
+        return InstanceToSolve(instance=instance)
+
+    return InstanceToSolve(
+        instance=instance,
+        messages_history=state.messages_history,
+        provider_needs_response=state.last_sender == "provider" and state.message_count < 20,
+        state_hash=state.last_message_hash,
+    )
+
+
+async def _get_instances_to_solve(
+    instance_ids: list[str], settings: Settings
+) -> dict[str, Optional[InstanceToSolve]]:
+    client = get_async_market_client(settings)
+    results = await asyncio.gather(
+        *(_get_instance_to_solve(client, instance_id, settings) for instance_id in instance_ids),
+        return_exceptions=True,
+    )
+
+    instances_to_solve = {}
+    for instance_id, result in zip(instance_ids, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to fetch instance {instance_id}: {result}")
+            result = None
+        instances_to_solve[instance_id] = result
+    return instances_to_solve
 
+
+def _mark_handled(instance_id: str) -> None:
+    state = _chat_states.get(instance_id)
+    if state is not None:
+        state.handled_timestamp = state.last_timestamp
+
+
+@metrics.timed("llm_call_duration_seconds", call_site="_clean_response")
 def _clean_response(response: str, conversation_history: str = None) -> str:
     prompt = """
     Below is a code review response and the previous conversation history. Extract and list only the NEW 
@@ -91,9 +178,9 @@ def _clean_response(response: str, conversation_history: str = None) -> str:
     """
 
     try:
-        cleaned = openai.chat.completions.create(
-            model="o1-mini",
-            messages=[
+        return chat_completion(
+            "o1-mini",
+            [
                 {
                     "role": "user",
                     "content": prompt.format(
@@ -105,7 +192,6 @@ def _clean_response(response: str, conversation_history: str = None) -> str:
                 },
             ],
         )
-        return cleaned.choices[0].message.content.strip()
 
     except Exception as e:
         logger.error(f"Failed to clean response with GPT-4: {e}")
@@ -114,7 +200,7 @@ def _clean_response(response: str, conversation_history: str = None) -> str:
 
 def _solve_instance(
     instance_to_solve: InstanceToSolve,
-) -> str:
+) -> Optional[str]:
     logger.info("Solving instance id: {}", instance_to_solve.instance["id"])
 
     system_prompt = (
@@ -165,25 +251,13 @@ def _solve_instance(
     solver_command += f"\nFiles view: {files_url}"
     solver_command += f"\nIssue: {issue_link.group(0)}"
 
+    # Aider pulls in a large dependency tree, so it is only loaded by solver workers.
+    from src.agents.aider_modify_repo import modify_repo_with_aider
+
+    # Failures raise, so the claim is released and the state retried, while only the
+    # reviewer's own verdict is recorded as needing no response.
     try:
         response = modify_repo_with_aider(ModelName.gpt_4o, solver_command, repo_info)
-        if not response:
-            logger.warning("Received empty response from Aider")
-            return None
-
-        if "NO_RESPONSE_NEEDED" in response:
-            logger.info("No response needed for this instance")
-            return None
-
-        cleaned_response = _clean_response(
-            response.strip(), conversation_history=instance_to_solve.messages_history
-        )
-        if cleaned_response == "NO_RESPONSE_NEEDED":
-            logger.info("No response needed for this instance")
-            return None
-
-        return cleaned_response
-
     except Exception as e:
         logger.error(
             "Error using Aider for instance {}: {}",
@@ -191,26 +265,42 @@ def _solve_instance(
             str(e),
             exc_info=True,
         )
+        raise
+
+    if not response:
+        raise RuntimeError("Received empty response from Aider")
+
+    if "NO_RESPONSE_NEEDED" in response:
+        logger.info("No response needed for this instance")
+        return None
+
+    cleaned_response = _clean_response(
+        response.strip(), conversation_history=instance_to_solve.messages_history
+    )
+    if cleaned_response == "NO_RESPONSE_NEEDED":
+        logger.info("No response needed for this instance")
         return None
 
+    return cleaned_response
 
-def get_awarded_proposals(settings: Settings) -> list[dict]:
-    try:
-        headers = {
-            "x-api-key": settings.market_api_key,
-        }
-        url = f"{settings.market_url}/v1/proposals/"
 
-        response = httpx.get(url, headers=headers)
-        response.raise_for_status()
-        all_proposals = response.json()
+async def get_awarded_proposals(settings: Settings) -> list[dict]:
+    try:
+        url = "/v1/proposals/"
 
         current_time = datetime.utcnow()
         one_day_ago = current_time - timedelta(days=1)
 
+        def is_too_old(proposal: dict) -> bool:
+            return (
+                settings.market_lists_newest_first
+                and datetime.fromisoformat(proposal["creation_date"]) <= one_day_ago
+            )
+
+        client = get_async_market_client(settings)
         awarded_proposals = [
             p
-            for p in all_proposals
+            async for p in MarketListReader(client, url, settings=settings, stop=is_too_old)
             if p["status"] == settings.market_awarded_proposal_code
             and datetime.fromisoformat(p["creation_date"]) > one_day_ago
         ]
@@ -221,39 +311,130 @@ def get_awarded_proposals(settings: Settings) -> list[dict]:
 
 def _send_message(instance_id: str, message: str, settings: Settings) -> Optional[bool]:
     try:
-        headers = {
-            "x-api-key": settings.market_api_key,
-        }
-        url = f"{settings.market_url}/v1/chat/send-message/{instance_id}"
+        url = f"/v1/chat/send-message/{instance_id}"
         data = {"message": message}
 
-        response = httpx.post(url, headers=headers, json=data)
+        response = get_market_client(settings).post(url, json=data)
         response.raise_for_status()
         return True
     except Exception:
         return None
 
 
-def solve_instances_handler() -> None:
+def _process_awarded_proposal(instance_to_solve: InstanceToSolve) -> SolveOutcome:
+    instance_id = instance_to_solve.instance["id"]
+    ledger = get_solve_ledger()
+    claim = ledger.claim(instance_id, instance_to_solve.state_hash)
+    if claim is None:
+        logger.info(f"Conversation state of instance {instance_id} is done or being solved")
+        return SolveOutcome.skipped
+
+    try:
+        message = claim.result
+        if message:
+            logger.info(f"Resending the undelivered response for instance {instance_id}")
+        else:
+            try:
+                message = _solve_instance(instance_to_solve)
+            except Exception as e:
+                logger.error(f"Failed to solve instance {instance_id}, releasing it: {e}")
+                ledger.release(claim)
+                return SolveOutcome.failed
+            if not message:
+                ledger.mark_no_response(claim)
+                return SolveOutcome.no_response
+            ledger.record_result(claim, message)
+
+        if _send_message(instance_id, message, SETTINGS) is None:
+            ledger.release(claim)
+            return SolveOutcome.delivery_failed
+
+        ledger.mark_delivered(claim)
+        return SolveOutcome.delivered
+    except BaseException:
+        ledger.release(claim)
+        raise
+
+
+def _get_executor(settings: Settings) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.solve_instances_max_concurrency)
+        logger.info(f"Started solver pool with {settings.solve_instances_max_concurrency} workers")
+    return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def solve_instances_handler() -> SolveCycleReport:
+    global _runner
     logger.info("Solve instances handler")
-    awarded_proposals = get_awarded_proposals(SETTINGS)
+    report = SolveCycleReport()
+    started_at = time.monotonic()
+
+    # Reusing one event loop keeps the pooled async client and its connections alive
+    # between cycles.
+    if _runner is None:
+        _runner = asyncio.Runner()
+    awarded_proposals = _runner.run(get_awarded_proposals(SETTINGS))
 
     if not awarded_proposals:
-        return
+        return report
 
+    report.awarded = len(awarded_proposals)
     logger.info(f"Found {len(awarded_proposals)} awarded proposals")
 
-    for p in awarded_proposals:
-        instance_to_solve = _get_instance_to_solve(p["instance_id"], SETTINGS)
-        if not instance_to_solve:
-            continue
-
-        if not instance_to_solve.provider_needs_response:
+    instance_ids = [p["instance_id"] for p in awarded_proposals]
+    for instance_id in set(_chat_states) - set(instance_ids):
+        del _chat_states[instance_id]
+    instances_to_solve = _runner.run(_get_instances_to_solve(instance_ids, SETTINGS))
+
+    pool_broken = False
+    futures = {}
+    ledger = get_solve_ledger()
+    ledger.prune()
+    for instance_id, instance_to_solve in instances_to_solve.items():
+        if (
+            not instance_to_solve
+            or not instance_to_solve.provider_needs_response
+            or ledger.is_done(instance_id, instance_to_solve.state_hash)
+        ):
+            if instance_to_solve:
+                _mark_handled(instance_id)
+            report.record(SolveOutcome.skipped)
             continue
 
-        message = _solve_instance(instance_to_solve)
-        if not message:
-            continue
-
-        if _send_message(instance_to_solve.instance["id"], message, SETTINGS) is None:
-            continue
+        executor = _get_executor(SETTINGS)
+        futures[executor.submit(_process_awarded_proposal, instance_to_solve)] = instance_id
+        metrics.set_gauge("solve_queue_depth", len(futures))
+
+    for completed, future in enumerate(as_completed(futures), start=1):
+        metrics.set_gauge("solve_queue_depth", len(futures) - completed)
+        instance_id = futures[future]
+        try:
+            outcome = future.result()
+        except BrokenProcessPool:
+            logger.error(f"Solver pool broke while processing instance {instance_id}")
+            pool_broken = True
+            outcome = SolveOutcome.failed
+        except Exception as e:
+            logger.error(f"Failed to process instance {instance_id}: {e}")
+            outcome = SolveOutcome.failed
+
+        logger.info(f"Instance {instance_id} processed with outcome {outcome.value}")
+        report.record(outcome)
+        # Failed attempts are retried on the next cycle even if nothing new arrived.
+        if outcome in (SolveOutcome.delivered, SolveOutcome.no_response):
+            _mark_handled(instance_id)
+
+    if pool_broken:
+        _reset_executor()
+
+    report.duration = time.monotonic() - started_at
+    logger.info(f"Solve instances cycle report: {report.summary()}")
+    return report
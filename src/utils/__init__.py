@@ -1,8 +1,12 @@
 from .agent_market import (
+    PrMetadata,
     format_messages,
+    generate_pr_metadata,
     get_pr_body,
+    get_pr_summary,
     get_pr_title,
     remove_all_urls,
+    remove_log_artifacts,
 )
 from .file_utils import change_directory_ownership_recursive, copy_file_to_directory
 from .git import (
@@ -30,6 +34,10 @@ __all__ = [
     "extract_repo_name_from_url",
     "get_pr_title",
     "get_pr_body",
+    "get_pr_summary",
+    "generate_pr_metadata",
+    "PrMetadata",
+    "remove_log_artifacts",
     "remove_all_urls",
     "set_git_config",
     "create_and_push_branch",
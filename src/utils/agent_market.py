@@ -1,70 +1,112 @@
+import hashlib
+import json
 import re
+from dataclasses import dataclass
 from typing import Optional
 
-import openai
+from loguru import logger
 
+from src import metrics
+from src.agents.prompt_cache import PromptCache
 from src.config import SETTINGS
+from src.utils.llm_client import chat_completion
+from src.utils.log_stream import ANSI_ESCAPE
 
-openai.api_key = SETTINGS.openai_api_key
 WEAK_MODEL = "gpt-4o-mini"
 
+_pr_metadata_cache: Optional[PromptCache] = None
+
+
+@dataclass
+class PrMetadata:
+    title: str
+    body: str
+    summary: str
 
-def get_pr_title(background: str) -> str:
-    response = openai.chat.completions.create(
-        model=WEAK_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an assistant that helps generate concise, "
-                    "professional pull request titles."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Based on the following background, "
-                    f"generate a pull request title: {background}"
-                ),
-            },
-        ],
-    )
-    return response.choices[0].message.content.strip()
+
+def get_pr_title(background: str, logs: str) -> str:
+    return generate_pr_metadata(background, logs).title
 
 
 def get_pr_body(background: str, logs: str) -> str:
+    return generate_pr_metadata(background, logs).body
+
+
+def get_pr_summary(background: str, logs: str) -> str:
+    """Return the agent logs rewritten for the user, as posted on the PR."""
+    return generate_pr_metadata(background, logs).summary
+
+
+def _add_fixes_reference(background: str, body: str) -> str:
     match = re.search(r"Issue Number: (\d+)", background)
     issue_number = match.group(1) if match else None
 
-    response = openai.chat.completions.create(
-        model=WEAK_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an assistant that helps generate detailed, "
-                    "clear, and professional pull request descriptions."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Based on the following background and git logs, "
-                    f"generate a pull request description.\n\n"
-                    f"Background:\n{background}\n\n"
-                    f"Git Logs:\n{logs}"
-                ),
-            },
-        ],
-    )
-    body = response.choices[0].message.content.strip()
-
     if issue_number is not None and f"fixes #{issue_number}" not in body.lower():
         body = f"{body}\n\nFixes #{issue_number}"
 
     return body
 
 
+def remove_log_artifacts(logs: str) -> str:
+    logs = ANSI_ESCAPE.sub("", logs).split("Tokens:")[0]
+    return logs.replace("Provider List:", "")
+
+
+def _get_pr_metadata_cache() -> PromptCache:
+    global _pr_metadata_cache
+    if _pr_metadata_cache is None:
+        _pr_metadata_cache = PromptCache(cache_dir=SETTINGS.pr_metadata_cache_dir)
+    return _pr_metadata_cache
+
+
+def generate_pr_metadata(background: str, logs: str) -> PrMetadata:
+    logs = remove_log_artifacts(logs)
+    cache_key = hashlib.sha256(f"{background}\0{logs}".encode()).hexdigest()
+
+    @metrics.timed("llm_call_duration_seconds", call_site="generate_pr_metadata")
+    def generate() -> str:
+        response = chat_completion(
+            WEAK_MODEL,
+            [
+                {
+                    "role": "system",
+                    "content": (
+                        "You are an assistant that helps generate pull requests. You answer "
+                        "with a JSON object with the keys 'title', 'body' and 'summary'."
+                    ),
+                },
+                {
+                    "role": "user",
+                    "content": (
+                        "Based on the following background and logs from an AI coding "
+                        "assistant, generate:\n"
+                        "- title: a concise, professional pull request title\n"
+                        "- body: a detailed, clear and professional pull request description\n"
+                        "- summary: the logs rewritten as a clear, concise message to a user, "
+                        "focusing on the important actions and changes made, without technical "
+                        "artifacts or redundant information\n\n"
+                        f"Background:\n{background}\n\n"
+                        f"Logs:\n{logs}"
+                    ),
+                },
+            ],
+            response_format={"type": "json_object"},
+        )
+        metadata = json.loads(response)
+        return json.dumps(
+            {key: str(metadata.get(key, "")).strip() for key in PrMetadata.__annotations__}
+        )
+
+    # Keyed by content hash, so a retried job reuses the metadata generated the first time.
+    metadata = json.loads(_get_pr_metadata_cache().get_or_compute(cache_key, WEAK_MODEL, generate))
+    logger.info(f"Generated pull request metadata with title: {metadata['title']}")
+    return PrMetadata(
+        title=metadata["title"],
+        body=_add_fixes_reference(background, metadata["body"]),
+        summary=metadata["summary"],
+    )
+
+
 def remove_all_urls(text: str) -> str:
     text = text.replace("Repository URL:", "")
     text = text.replace("Issue URL:", "")
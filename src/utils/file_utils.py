@@ -1,8 +1,10 @@
+import fcntl
 import os
 import shutil
 import subprocess
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union
+from typing import Iterator, Union
 
 from loguru import logger
 
@@ -23,3 +25,15 @@ def change_directory_ownership_recursive(
 ) -> None:
     subprocess.run(["chown", "-R", f"{user}:{group}", str(directory)], check=True)
     logger.info(f"Changed ownership of {directory} to {user}:{group}")
+
+
+@contextmanager
+def file_lock(lock_path: Union[Path, str], blocking: bool = True) -> Iterator[None]:
+    Path(lock_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        # Raises BlockingIOError when non-blocking and the lock is held elsewhere.
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
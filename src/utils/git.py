@@ -1,13 +1,25 @@
+import base64
+import hashlib
 import os
 import re
 import shutil
 import time
+from pathlib import Path
 from typing import Optional
+from urllib.parse import unquote, urlsplit
 
-import git
-import github
 from loguru import logger
 
+from src import metrics
+from src.config import SETTINGS
+from src.utils.file_utils import file_lock
+from src.utils.github_client import (
+    PrFile,
+    PullRequestContext,
+    PullRequestContextFetcher,
+    parse_pr_url,
+)
+
 
 def find_github_repo_url(text: str) -> Optional[str]:
     pattern = r"https://github.com/[^\s]+"
@@ -17,20 +29,165 @@ def find_github_repo_url(text: str) -> Optional[str]:
     return None
 
 
-def clone_repository(repo_url: str, target_dir: str, branch: str = None) -> None:
+def _strip_credentials(repo_url: str) -> str:
+    return re.sub(r"://[^/@]+@", "://", repo_url)
+
+
+def get_mirror_path(repo_url: str) -> Path:
+    """Return where the local mirror of a repository is kept, whatever credentials its URL has."""
+    normalized_url = _strip_credentials(repo_url).rstrip("/").removesuffix(".git").lower()
+    url_hash = hashlib.sha256(normalized_url.encode()).hexdigest()[:16]
+    repo_name = normalized_url.rsplit("/", 1)[-1]
+    return Path(SETTINGS.git_mirror_cache_dir) / f"{repo_name}-{url_hash}.git"
+
+
+# Branches and tags only: a mirror clone of a GitHub repository also fetches the head
+# and merge ref of every pull request ever opened.
+_MIRROR_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+
+
+def _auth_environment(repo_url: str) -> dict[str, str]:
+    """Return environment variables passing the credentials of a URL to one git command.
+
+    The mirror stores the URL without credentials, and the environment keeps them out of
+    the command line.
+    """
+    parts = urlsplit(repo_url)
+    if not parts.username:
+        return {}
+    userinfo = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+    header = f"Authorization: Basic {base64.b64encode(userinfo.encode()).decode()}"
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": header,
+    }
+
+
+def _fetch_mirror(repo, repo_url: str, *args: str) -> None:
+    with repo.git.custom_environment(**_auth_environment(repo_url)):
+        repo.git.fetch(*args)
+
+
+def _configure_mirror(repo, repo_url: str) -> None:
+    # Also updates mirrors created with `git clone --mirror`, which stored the full URL
+    # and fetched every ref.
+    repo.git.remote("set-url", "origin", _strip_credentials(repo_url))
+    repo.git.config("--replace-all", "remote.origin.fetch", _MIRROR_REFSPECS[0])
+    for refspec in _MIRROR_REFSPECS[1:]:
+        repo.git.config("--add", "remote.origin.fetch", refspec)
+    repo.git.config("--unset-all", "remote.origin.mirror", with_exceptions=False)
+
+
+def update_repository_mirror(repo_url: str, partial: bool = False) -> str:
+    """Create or incrementally refresh the local bare mirror of a repository."""
+    import git
+
+    mirror_path = get_mirror_path(repo_url)
+    with file_lock(f"{mirror_path}.lock"):
+        if (mirror_path / "HEAD").exists():
+            repo = git.Repo(mirror_path)
+            _configure_mirror(repo, repo_url)
+            _fetch_mirror(repo, repo_url, "--prune", "origin")
+            logger.info(f"Refreshed mirror of {_strip_credentials(repo_url)} at {mirror_path}")
+        else:
+            if mirror_path.exists():
+                shutil.rmtree(mirror_path)
+            clone_kwargs = {"bare": True}
+            if partial:
+                clone_kwargs["filter"] = "blob:none"
+            repo = git.Repo.clone_from(
+                _strip_credentials(repo_url),
+                mirror_path,
+                env=_auth_environment(repo_url),
+                **clone_kwargs,
+            )
+            # A bare clone sets up no fetch refspec, so later fetches would update nothing.
+            _configure_mirror(repo, repo_url)
+            logger.info(f"Created mirror of {_strip_credentials(repo_url)} at {mirror_path}")
+    return str(mirror_path)
+
+
+def fetch_mirror_refs(repo_url: str, *refspecs: str) -> None:
+    """Fetch refs the mirror does not track, such as the head of a single pull request."""
+    import git
+
+    mirror_path = get_mirror_path(repo_url)
+    with file_lock(f"{mirror_path}.lock"):
+        _fetch_mirror(git.Repo(mirror_path), repo_url, "origin", *refspecs)
+
+
+def _clone_from_mirror(
+    repo_url: str, target_dir: str, branch: Optional[str], depth: Optional[int], partial: bool
+) -> None:
+    import git
+
+    mirror_path = update_repository_mirror(repo_url, partial)
+    clone_kwargs = {}
+    if branch:
+        clone_kwargs["branch"] = branch
+
+    if partial:
+        # Missing blobs are fetched lazily from the real remote, everything else is
+        # borrowed from the mirror through alternates.
+        clone_kwargs.update({"filter": "blob:none", "reference": mirror_path})
+        if depth:
+            clone_kwargs["depth"] = depth
+        git.Repo.clone_from(repo_url, target_dir, **clone_kwargs)
+        return
+
+    if depth:
+        # Shallow clones are only honoured over a transport, not for plain local paths.
+        clone_kwargs["depth"] = depth
+        repo = git.Repo.clone_from(f"file://{mirror_path}", target_dir, **clone_kwargs)
+    else:
+        repo = git.Repo.clone_from(mirror_path, target_dir, **clone_kwargs)
+    repo.remotes.origin.set_url(repo_url)
+
+
+@metrics.timed("git_operation_duration_seconds", operation="clone_repository")
+def clone_repository(
+    repo_url: str,
+    target_dir: str,
+    branch: str = None,
+    depth: Optional[int] = None,
+    partial: Optional[bool] = None,
+) -> None:
+    import git
+
     if os.path.exists(target_dir):
         shutil.rmtree(target_dir)
 
     os.makedirs(target_dir)
+    depth = depth if depth is not None else SETTINGS.git_clone_depth
+    partial = partial if partial is not None else SETTINGS.git_clone_partial
+
+    if SETTINGS.git_mirror_cache_enabled:
+        try:
+            _clone_from_mirror(repo_url, target_dir, branch, depth, partial)
+            logger.info(
+                f"Cloned repository from {_strip_credentials(repo_url)} "
+                f"(branch: {branch or 'default'}) to {target_dir} using the local mirror"
+            )
+            return
+        except Exception as e:
+            logger.warning(f"Failed to clone from local mirror, cloning from remote: {e}")
+            shutil.rmtree(target_dir)
+            os.makedirs(target_dir)
+
+    clone_kwargs = {"depth": depth} if depth else {}
     if branch:
-        git.Repo.clone_from(repo_url, target_dir, branch=branch)
+        git.Repo.clone_from(repo_url, target_dir, branch=branch, **clone_kwargs)
         logger.info(f"Cloned repository from {repo_url} (branch: {branch}) to {target_dir}")
     else:
-        git.Repo.clone_from(repo_url, target_dir)
+        git.Repo.clone_from(repo_url, target_dir, **clone_kwargs)
         logger.info(f"Cloned repository from {repo_url} to {target_dir}")
 
 
+@metrics.timed("git_operation_duration_seconds", operation="fork_repo")
 def fork_repo(github_url: str, github_token: str) -> str:
+    import github
+
     g = github.Github(github_token)
     repo_path = github_url.replace("https://github.com/", "").removesuffix(".git")
     repo = g.get_repo(repo_path)
@@ -41,6 +198,8 @@ def fork_repo(github_url: str, github_token: str) -> str:
 
 
 def add_and_commit(repo_path: str) -> None:
+    import git
+
     try:
         repo = git.Repo(repo_path)
         logger.info(f"Repository initialized at {repo_path}")
@@ -65,6 +224,8 @@ def add_and_commit(repo_path: str) -> None:
 
 
 def push_commits(repo_path: str, github_token: str) -> bool:
+    import git
+
     try:
         repo = git.Repo(repo_path)
 
@@ -107,6 +268,9 @@ def create_pull_request(
     pr_body: str = None,
     base_branch: str = "main",
 ) -> str:
+    import git
+    import github
+
     try:
         repo = git.Repo(source_repo_path)
         g = github.Github(github_token)
@@ -220,6 +384,8 @@ def extract_repo_name_from_url(repo_url: str) -> str:
 
 
 def set_git_config(username: str, email: str, repo_dir: str):
+    import git
+
     try:
         repo = git.Repo(repo_dir)
         with repo.config_writer() as git_config:
@@ -234,6 +400,9 @@ def set_git_config(username: str, email: str, repo_dir: str):
 
 
 def create_and_push_branch(repo_path, branch_name, github_token):
+    import git
+    import github
+
     try:
         repo = git.Repo(repo_path)
         repo.remotes.origin.fetch()
@@ -300,42 +469,40 @@ def create_and_push_branch(repo_path, branch_name, github_token):
         logger.error(f"Error: {e}")
 
 
-def get_last_pr_comments(pr_url: str, github_token: str) -> str | bool:
-    g = github.Github(github_token)
+def _get_local_pr_files(pr_url: str, context: PullRequestContext) -> Optional[list[PrFile]]:
+    """Compute the PR diff from the mirror cache, or return None to use GitHub's diff."""
+    if not SETTINGS.git_mirror_cache_enabled:
+        return None
 
-    pr_path = pr_url.split("github.com/")[-1]
-    owner_repo, pr_number = pr_path.split("/pull/")
-    pr_number = int(pr_number)
+    from src.utils.pr_diff import compute_pr_diff
 
-    repo = g.get_repo(owner_repo)
-    pr = repo.get_pull(pr_number)
+    owner, name, number = parse_pr_url(pr_url)
+    repo_url = f"https://github.com/{owner}/{name}.git"
+    try:
+        return compute_pr_diff(repo_url, context.base_sha, context.head_sha, pr_number=number)
+    except Exception as e:
+        logger.warning(f"Failed to compute the PR diff locally, using GitHub's diff: {e}")
+        return None
 
-    issue_comments = list(pr.get_issue_comments())
-    review_comments = list(pr.get_review_comments())
 
-    last_issue_comment = issue_comments[-1] if issue_comments else None
-    last_review_comment = review_comments[-1] if review_comments else None
+def get_last_pr_comments(pr_url: str, github_token: str) -> str | bool:
+    fetcher = PullRequestContextFetcher(github_token)
+    context = fetcher.fetch(pr_url, with_diff=False)
 
-    last_comment = None
-    if last_issue_comment and last_review_comment:
-        last_comment = (
-            last_issue_comment
-            if last_issue_comment.created_at > last_review_comment.created_at
-            else last_review_comment
-        )
-    elif last_issue_comment:
-        last_comment = last_issue_comment
-    elif last_review_comment:
-        last_comment = last_review_comment
-    else:
+    last_comment = context.last_comment
+    if last_comment is None:
         return False  # No comments found
 
-    if last_comment.user.login == g.get_user().login:
+    if last_comment.author == context.viewer_login:
         return False
 
-    diff_content = pr.get_files()
+    files = _get_local_pr_files(pr_url, context)
+    if files is None:
+        fetcher.ensure_diff(pr_url, context)
+        files = context.files
+
     diff_text = []
-    for file in diff_content:
+    for file in files:
         diff_text.append(f"File: {file.filename}")
         diff_text.append(f"Status: {file.status}")
         diff_text.append(f"Changes: +{file.additions} -{file.deletions}")
@@ -343,15 +510,13 @@ def get_last_pr_comments(pr_url: str, github_token: str) -> str | bool:
 
     comments = []
 
-    issue_comments = pr.get_issue_comments()
-    for comment in issue_comments:
-        comments.append(f"Comment by {comment.user.login} at {comment.created_at}:")
+    for comment in context.comments:
+        comments.append(f"Comment by {comment.author} at {comment.created_at}:")
         comments.append(comment.body)
         comments.append("---")
 
-    review_comments = pr.get_review_comments()
-    for comment in review_comments:
-        comments.append(f"Review comment by {comment.user.login} at {comment.created_at}:")
+    for comment in context.review_comments:
+        comments.append(f"Review comment by {comment.author} at {comment.created_at}:")
         comments.append(f"File: {comment.path}, Line: {comment.line}")
         comments.append(comment.body)
         comments.append("---")
@@ -485,6 +650,8 @@ def _build_solver_command_from_chat(background: str, user_messages: str) -> str:
 
 
 def add_aider_logs_as_pr_comments(pr_url: str, github_token: str, logs: str) -> None:
+    import github
+
     g = github.Github(github_token)
 
     pr_path = pr_url.split("github.com/")[-1]
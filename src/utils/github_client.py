@@ -0,0 +1,371 @@
+import atexit
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+from src.config import SETTINGS, Settings
+
+TIMEOUT = httpx.Timeout(30.0)
+
+_PR_CONTEXT_QUERY = """
+query (
+  $owner: String!, $name: String!, $number: Int!,
+  $commentsCursor: String, $threadsCursor: String, $filesCursor: String,
+  $withComments: Boolean!, $withThreads: Boolean!, $withFiles: Boolean!
+) {
+  viewer { login }
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      headRefOid
+      baseRefOid
+      comments(first: 100, after: $commentsCursor) @include(if: $withComments) {
+        pageInfo { hasNextPage endCursor }
+        nodes { author { login } createdAt body }
+      }
+      reviewThreads(first: 50, after: $threadsCursor) @include(if: $withThreads) {
+        pageInfo { hasNextPage endCursor }
+        nodes { comments(first: 100) { nodes { author { login } createdAt body path line } } }
+      }
+      files(first: 100, after: $filesCursor) @include(if: $withFiles) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path additions deletions changeType }
+      }
+    }
+  }
+}
+"""
+
+# GraphQL names the change types of files differently from the REST API and git.
+_CHANGE_TYPE_STATUSES = {
+    "ADDED": "added",
+    "DELETED": "removed",
+    "MODIFIED": "modified",
+    "RENAMED": "renamed",
+    "COPIED": "copied",
+    "CHANGED": "changed",
+}
+
+
+@dataclass
+class PrComment:
+    author: str
+    created_at: str
+    body: str
+    path: Optional[str] = None
+    line: Optional[int] = None
+
+    @property
+    def is_review_comment(self) -> bool:
+        return self.path is not None
+
+
+@dataclass
+class PrFile:
+    filename: str
+    status: str
+    additions: int
+    deletions: int
+    patch: Optional[str] = None
+
+
+@dataclass
+class PullRequestContext:
+    viewer_login: str
+    head_sha: str
+    base_sha: str
+    comments: list[PrComment] = field(default_factory=list)
+    review_comments: list[PrComment] = field(default_factory=list)
+    files: list[PrFile] = field(default_factory=list)
+    comments_cursor: Optional[str] = None
+    files_head_sha: Optional[str] = None
+    diff_key: Optional[str] = None
+    diff_etag: Optional[str] = None
+
+    @property
+    def revision_key(self) -> str:
+        return f"{self.base_sha}...{self.head_sha}"
+
+    @property
+    def last_comment(self) -> Optional[PrComment]:
+        all_comments = self.comments + self.review_comments
+        return max(all_comments, key=lambda comment: comment.created_at, default=None)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PullRequestContext":
+        data = dict(data)
+        data["comments"] = [PrComment(**comment) for comment in data["comments"]]
+        data["review_comments"] = [PrComment(**comment) for comment in data["review_comments"]]
+        data["files"] = [PrFile(**file) for file in data["files"]]
+        return cls(**data)
+
+
+_clients: dict[str, httpx.Client] = {}
+_clients_pid: Optional[int] = None
+
+
+def get_github_client(github_token: str, settings: Settings = SETTINGS) -> httpx.Client:
+    global _clients, _clients_pid
+    # Like the market client, a pool inherited through fork is never reused.
+    if _clients_pid != os.getpid():
+        _clients = {}
+        _clients_pid = os.getpid()
+
+    token_key = hashlib.sha256(github_token.encode()).hexdigest()
+    if token_key not in _clients:
+        _clients[token_key] = httpx.Client(
+            base_url=settings.github_api_url,
+            headers={
+                "Authorization": f"Bearer {github_token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+            timeout=TIMEOUT,
+        )
+        logger.debug(f"Created GitHub HTTP client for process {_clients_pid}")
+    return _clients[token_key]
+
+
+def close_github_clients() -> None:
+    global _clients
+    if _clients_pid == os.getpid():
+        for client in _clients.values():
+            client.close()
+    _clients = {}
+
+
+atexit.register(close_github_clients)
+
+
+def parse_pr_url(pr_url: str) -> tuple[str, str, int]:
+    pr_path = pr_url.split("github.com/")[-1]
+    owner_repo, pr_number = pr_path.split("/pull/")
+    owner, name = owner_repo.split("/")
+    return owner, name, int(pr_number.strip("/").split("/")[0])
+
+
+def split_diff_by_file(diff: str) -> dict[str, str]:
+    """Split a unified diff into the hunks of each file, keyed by the new path."""
+    patches = {}
+    for file_diff in diff.split("diff --git ")[1:]:
+        header, _, hunks = file_diff.partition("\n@@")
+        path = header.split("\n", 1)[0].rsplit(" b/", 1)[-1]
+        patches[path] = f"@@{hunks}".rstrip("\n") if hunks else None
+    return patches
+
+
+class PullRequestContextFetcher:
+    def __init__(self, github_token: str, settings: Settings = SETTINGS):
+        self.client = get_github_client(github_token, settings)
+        self.cache_dir = Path(settings.github_cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _cache_path(self, owner: str, name: str, number: int) -> Path:
+        key = hashlib.sha256(f"{owner}/{name}#{number}".lower().encode()).hexdigest()[:16]
+        return self.cache_dir / f"pr-{key}.json"
+
+    def _load(self, cache_path: Path) -> Optional[PullRequestContext]:
+        if not cache_path.exists():
+            return None
+
+        try:
+            with open(cache_path, "r") as f:
+                return PullRequestContext.from_dict(json.load(f))
+        except Exception as e:
+            logger.error(f"Error reading PR context cache {cache_path}: {e}")
+            return None
+
+    def _save(self, cache_path: Path, context: PullRequestContext) -> None:
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(asdict(context), f)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.error(f"Error writing PR context cache {cache_path}: {e}")
+
+    def _query(self, variables: dict) -> dict:
+        response = self.client.post(
+            "/graphql", json={"query": _PR_CONTEXT_QUERY, "variables": variables}
+        )
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get("errors"):
+            raise ValueError(f"GitHub GraphQL query failed: {payload['errors']}")
+        return payload["data"]
+
+    def _fetch_pages(
+        self,
+        variables: dict,
+        comments_cursor: Optional[str] = None,
+        with_comments: bool = False,
+        with_threads: bool = False,
+        with_files: bool = False,
+    ) -> tuple[dict, dict[str, list[dict]], Optional[str]]:
+        """Run the context query, following every requested connection to its last page."""
+        pending = {"comments": with_comments, "reviewThreads": with_threads, "files": with_files}
+        cursors = {"comments": comments_cursor, "reviewThreads": None, "files": None}
+        nodes: dict[str, list[dict]] = {"comments": [], "reviewThreads": [], "files": []}
+        first_page = None
+
+        while any(pending.values()):
+            data = self._query(
+                {
+                    **variables,
+                    "commentsCursor": cursors["comments"],
+                    "threadsCursor": cursors["reviewThreads"],
+                    "filesCursor": cursors["files"],
+                    "withComments": pending["comments"],
+                    "withThreads": pending["reviewThreads"],
+                    "withFiles": pending["files"],
+                }
+            )
+            first_page = first_page or data
+            pull_request = data["repository"]["pullRequest"]
+            for connection, is_pending in pending.items():
+                if not is_pending:
+                    continue
+                page = pull_request[connection]
+                nodes[connection].extend(page["nodes"])
+                page_info = page["pageInfo"]
+                # Keep the last cursor even on the final page, so the next fetch resumes there.
+                if page_info["endCursor"]:
+                    cursors[connection] = page_info["endCursor"]
+                pending[connection] = page_info["hasNextPage"]
+
+        return first_page, nodes, cursors["comments"]
+
+    def _fetch_diff(self, owner: str, name: str, number: int, context: PullRequestContext) -> None:
+        """Attach per-file patches from the PR diff, revalidating the cached diff by ETag."""
+        headers = {"Accept": "application/vnd.github.diff"}
+        # The ETag only describes the patches if they survived, i.e. the head did not move.
+        if context.diff_etag and any(file.patch for file in context.files):
+            headers["If-None-Match"] = context.diff_etag
+
+        response = self.client.get(f"/repos/{owner}/{name}/pulls/{number}", headers=headers)
+        if response.status_code == 304:
+            logger.debug(f"Diff of {owner}/{name}#{number} is unchanged")
+            context.diff_key = context.revision_key
+            return
+        if response.status_code == 406:
+            # GitHub refuses to render diffs that are too large, but still lists the patches.
+            logger.debug(f"Diff of {owner}/{name}#{number} is too large, fetching its files")
+            patches = self._fetch_file_patches(owner, name, number)
+            etag = None
+        else:
+            response.raise_for_status()
+            patches = split_diff_by_file(response.text)
+            etag = response.headers.get("etag")
+
+        for file in context.files:
+            file.patch = patches.get(file.filename)
+        context.diff_etag = etag
+        context.diff_key = context.revision_key
+
+    def _fetch_file_patches(self, owner: str, name: str, number: int) -> dict[str, str]:
+        """Fetch the per-file patches of a PR from the REST files listing."""
+        patches = {}
+        url = f"/repos/{owner}/{name}/pulls/{number}/files"
+        params = {"per_page": 100}
+        while url:
+            response = self.client.get(url, params=params)
+            response.raise_for_status()
+            for file in response.json():
+                patches[file["filename"]] = file.get("patch")
+            # The next link already carries the query parameters.
+            url = response.links.get("next", {}).get("url")
+            params = None
+        return patches
+
+    def fetch(self, pr_url: str, with_diff: bool = True) -> PullRequestContext:
+        """Fetch the comments, files and viewer of a PR, reusing what is cached for it."""
+        owner, name, number = parse_pr_url(pr_url)
+        cache_path = self._cache_path(owner, name, number)
+        cached = self._load(cache_path)
+        variables = {"owner": owner, "name": name, "number": number}
+
+        # Only comments after the cached cursor are fetched. Files only change with the
+        # head commit, so a cached list is fetched again only if the head moved.
+        first_page, nodes, comments_cursor = self._fetch_pages(
+            variables,
+            comments_cursor=cached.comments_cursor if cached else None,
+            with_comments=True,
+            with_threads=True,
+            with_files=cached is None,
+        )
+        pull_request = first_page["repository"]["pullRequest"]
+        head_sha = pull_request["headRefOid"]
+
+        files_changed = cached is None or cached.files_head_sha != head_sha
+        if cached and files_changed:
+            _, file_nodes, _ = self._fetch_pages(variables, with_files=True)
+            nodes["files"] = file_nodes["files"]
+
+        if files_changed:
+            files = [
+                PrFile(
+                    filename=node["path"],
+                    status=_CHANGE_TYPE_STATUSES.get(node["changeType"], "changed"),
+                    additions=node["additions"],
+                    deletions=node["deletions"],
+                )
+                for node in nodes["files"]
+            ]
+        else:
+            files = cached.files
+
+        review_comments = [
+            PrComment(
+                author=(node["author"] or {}).get("login", "ghost"),
+                created_at=node["createdAt"],
+                body=node["body"],
+                path=node["path"],
+                line=node["line"],
+            )
+            for thread in nodes["reviewThreads"]
+            for node in thread["comments"]["nodes"]
+        ]
+        review_comments.sort(key=lambda comment: comment.created_at)
+
+        context = PullRequestContext(
+            viewer_login=first_page["viewer"]["login"],
+            head_sha=head_sha,
+            base_sha=pull_request["baseRefOid"],
+            comments=(cached.comments if cached else [])
+            + [
+                PrComment(
+                    author=(node["author"] or {}).get("login", "ghost"),
+                    created_at=node["createdAt"],
+                    body=node["body"],
+                )
+                for node in nodes["comments"]
+            ],
+            review_comments=review_comments,
+            files=files,
+            comments_cursor=comments_cursor,
+            files_head_sha=head_sha,
+            diff_key=cached.diff_key if cached and not files_changed else None,
+            diff_etag=cached.diff_etag if cached else None,
+        )
+
+        if with_diff:
+            self._ensure_diff(owner, name, number, context)
+        self._save(cache_path, context)
+        return context
+
+    def ensure_diff(self, pr_url: str, context: PullRequestContext) -> None:
+        """Make sure the file patches of a context fetched without its diff are loaded."""
+        owner, name, number = parse_pr_url(pr_url)
+        if self._ensure_diff(owner, name, number, context):
+            self._save(self._cache_path(owner, name, number), context)
+
+    def _ensure_diff(self, owner: str, name: str, number: int, context: PullRequestContext) -> bool:
+        if context.diff_key == context.revision_key:
+            return False
+        self._fetch_diff(owner, name, number, context)
+        return True
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from src.enums import InstanceDecision
+
+
+def instance_marker(instance: dict) -> str:
+    """Build the update marker used to detect changes to an instance."""
+    for key in ("updated_at", "last_updated", "modification_date"):
+        if instance.get(key):
+            return str(instance[key])
+
+    serialized = json.dumps(instance, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class SeenInstanceIndex:
+    def __init__(self, index_path: str = "/tmp/agent_market/seen_instances.json"):
+        self.index_path = Path(index_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._instances: dict[str, dict] = {}
+        self._validators: dict[str, dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        """Load the index from disk, starting empty if it is missing or corrupted."""
+        if not self.index_path.exists():
+            return
+
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+            self._instances = data.get("instances", {})
+            self._validators = data.get("validators", {})
+            logger.info(f"Loaded {len(self._instances)} seen instances from {self.index_path}")
+        except Exception as e:
+            logger.error(f"Error reading seen-instance index {self.index_path}: {e}")
+
+    def save(self) -> None:
+        """Atomically write the index to disk."""
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"instances": self._instances, "validators": self._validators}, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"Error writing seen-instance index {self.index_path}: {e}")
+
+    def is_current(self, instance: dict) -> bool:
+        """Check if the instance was already handled in its current state."""
+        entry = self._instances.get(str(instance["id"]))
+        if entry is None:
+            return False
+
+        # A proposal stays valid whatever happens to the instance afterwards.
+        if entry["decision"] == InstanceDecision.proposed.value:
+            return True
+
+        return entry["marker"] == instance_marker(instance)
+
+    def record(self, instance: dict, decision: InstanceDecision) -> None:
+        """Record the decision taken for an instance in its current state."""
+        self._instances[str(instance["id"])] = {
+            "marker": instance_marker(instance),
+            "decision": decision.value,
+        }
+
+    def retain(self, instance_ids: set[str]) -> None:
+        """Drop instances that are no longer listed as open."""
+        stale_ids = set(self._instances) - {str(i) for i in instance_ids}
+        for instance_id in stale_ids:
+            del self._instances[instance_id]
+        if stale_ids:
+            logger.debug(f"Dropped {len(stale_ids)} closed instances from the index")
+
+    def conditional_headers(self, url: str) -> dict:
+        """Build the conditional request headers for a previously fetched URL."""
+        validators = self._validators.get(url, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def store_validators(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        """Remember the response validators returned for a URL."""
+        if etag or last_modified:
+            self._validators[url] = {"etag": etag, "last_modified": last_modified}
+        else:
+            self._validators.pop(url, None)
+
+    def __len__(self) -> int:
+        return len(self._instances)
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from src.config import SETTINGS, Settings
+from src.utils.process_utils import ProcessLocalDatabase
+
+_DEFAULT_COMPLETION_TOKENS = 512
+
+
+def _retryable_errors() -> tuple[type[Exception], ...]:
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class TokenBucket:
+    """A rate limit shared by all processes through a SQLite database."""
+
+    def __init__(self, name: str, capacity_per_minute: float, database: ProcessLocalDatabase):
+        self.name = name
+        self.capacity = capacity_per_minute
+        self.refill_rate = capacity_per_minute / 60
+        self._database = database
+        self._lock = asyncio.Lock()
+
+    def _take(self, amount: float) -> float:
+        """Take the amount if the bucket holds it, returning how long to wait otherwise."""
+        now = time.time()
+        connection = self._database.connect()
+        # An immediate transaction takes the write lock before reading, so two processes
+        # can never spend the same tokens.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            tokens = self.capacity
+            if row is not None:
+                tokens = min(self.capacity, row[0] + max(0.0, now - row[1]) * self.refill_rate)
+            wait = 0.0
+            if tokens >= amount:
+                tokens -= amount
+            else:
+                wait = (amount - tokens) / self.refill_rate
+            connection.execute(
+                "INSERT INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, "
+                "updated_at = excluded.updated_at",
+                (self.name, tokens, now),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    async def acquire(self, amount: float) -> None:
+        """Wait until the amount can be taken from the bucket."""
+        # Requests larger than the whole bucket would wait forever, so cap them.
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                wait = self._take(amount)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+
+
+def _estimate_tokens(messages: list[dict], max_tokens: Optional[int]) -> int:
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+    return prompt_chars // 4 + (max_tokens or _DEFAULT_COMPLETION_TOKENS)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after_ms = response.headers.get("retry-after-ms")
+        if retry_after_ms:
+            return float(retry_after_ms) / 1000
+        retry_after = response.headers.get("retry-after")
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            return float(retry_after)
+    return min(60, 2**attempt) * random.uniform(0.5, 1)
+
+
+class LLMClient:
+    def __init__(self, settings: Settings):
+        # The OpenAI SDK is slow to import, so processes that never call a model skip it.
+        import openai
+
+        self.settings = settings
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._client = openai.AsyncOpenAI(api_key=settings.openai_api_key, max_retries=0)
+        Path(settings.llm_rate_limit_path).parent.mkdir(parents=True, exist_ok=True)
+        database = ProcessLocalDatabase(settings.llm_rate_limit_path, _SCHEMA)
+        self._request_bucket = TokenBucket("requests", settings.llm_requests_per_minute, database)
+        self._token_bucket = TokenBucket("tokens", settings.llm_tokens_per_minute, database)
+        self._model_semaphores: dict[str, asyncio.Semaphore] = {}
+        self._retryable_errors = _retryable_errors()
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_semaphores:
+            self._model_semaphores[model] = asyncio.Semaphore(
+                self.settings.llm_max_concurrency_per_model
+            )
+        return self._model_semaphores[model]
+
+    async def _chat_completion(self, model: str, messages: list[dict], **kwargs) -> str:
+        estimated_tokens = _estimate_tokens(messages, kwargs.get("max_tokens"))
+        attempt = 0
+        while True:
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimated_tokens)
+            try:
+                async with self._semaphore(model):
+                    response = await self._client.chat.completions.create(
+                        model=model, messages=messages, **kwargs
+                    )
+                return response.choices[0].message.content.strip()
+            except self._retryable_errors as e:
+                attempt += 1
+                if attempt > self.settings.llm_max_retries:
+                    raise
+                delay = _retry_delay(e, attempt)
+                logger.warning(
+                    f"LLM call to {model} failed ({e.__class__.__name__}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt})"
+                )
+                await asyncio.sleep(delay)
+
+    def chat_completion(self, model: str, messages: list[dict], **kwargs) -> str:
+        """Run a chat completion from synchronous code and return the message content."""
+        future = asyncio.run_coroutine_threadsafe(
+            self._chat_completion(model, messages, **kwargs), self._loop
+        )
+        return future.result()
+
+    async def achat_completion(self, model: str, messages: list[dict], **kwargs) -> str:
+        """Run a chat completion from any event loop and return the message content."""
+        future = asyncio.run_coroutine_threadsafe(
+            self._chat_completion(model, messages, **kwargs), self._loop
+        )
+        return await asyncio.wrap_future(future)
+
+
+_llm_client: Optional[LLMClient] = None
+_llm_client_pid: Optional[int] = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client(settings: Settings = SETTINGS) -> LLMClient:
+    global _llm_client, _llm_client_pid
+    with _llm_client_lock:
+        # The event loop thread does not survive fork, so each process builds its own.
+        if _llm_client is None or _llm_client_pid != os.getpid():
+            _llm_client = LLMClient(settings)
+            _llm_client_pid = os.getpid()
+    return _llm_client
+
+
+def chat_completion(model: str, messages: list[dict], **kwargs) -> str:
+    return get_llm_client().chat_completion(model, messages, **kwargs)
+
+
+async def achat_completion(model: str, messages: list[dict], **kwargs) -> str:
+    return await get_llm_client().achat_completion(model, messages, **kwargs)
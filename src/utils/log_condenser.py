@@ -0,0 +1,249 @@
+import re
+
+from loguru import logger
+
+from src.utils.llm_client import chat_completion
+
+WEAK_MODEL = "gpt-4o-mini"
+
+_encoding = None
+_encoding_loaded = False
+
+_PROGRESS_LINE = re.compile(
+    r"^\s*(\d{1,3}(\.\d+)?%|[━─█▏▎▍▌▋▊▉░▒▓#=>\-\s]{8,}$|"
+    r"(Downloading|Fetching|Receiving objects|Resolving deltas|Unpacking|Counting objects|"
+    r"Compressing objects|Collecting|Using cached)\b)"
+)
+_SPINNER_LINE = re.compile(r"^\s*[⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏|/\\-]\s*(Waiting|Thinking|Loading)?\W*$")
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+_DIFF_HEADER = re.compile(
+    r"^(index [0-9a-f]+\.\.|--- |\+\+\+ |(new|deleted) file mode |(old|new) mode |"
+    r"similarity index |rename (from|to) |Binary files |\\ )"
+)
+_EDIT_BLOCK_MARKER = re.compile(r"^(<<<<<<< SEARCH|=======|>>>>>>> REPLACE)")
+_ERROR_LINE = re.compile(
+    r"(Traceback \(most recent call last\)|\b\w*(Error|Exception)\b|\bFAILED\b|\bfailed\b|"
+    r"^\s+File \".*\", line \d+)"
+)
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    # Loading the encoding may download it, so it waits until tokens are first counted.
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"Counting tokens by characters, tiktoken is unavailable: {e}")
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _collapse_lines(lines: list[str], important: set[int]) -> tuple[list[str], set[int]]:
+    """Drop progress output and repeated lines, never touching the important ones.
+
+    Returns the remaining lines and the new positions of the important ones.
+    """
+    collapsed = []
+    kept_important = set()
+    previous = None
+    repeats = 0
+    for i, line in enumerate(lines):
+        if i not in important:
+            if _PROGRESS_LINE.match(line) or _SPINNER_LINE.match(line):
+                continue
+            if line == previous:
+                repeats += 1
+                continue
+
+        if repeats:
+            collapsed.append(f"[previous line repeated {repeats} more times]")
+        if i in important:
+            kept_important.add(len(collapsed))
+            previous = None
+        else:
+            previous = line
+        collapsed.append(line)
+        repeats = 0
+
+    if repeats:
+        collapsed.append(f"[previous line repeated {repeats} more times]")
+    return collapsed, kept_important
+
+
+def _diff_lines(lines: list[str]) -> set[int]:
+    """Find the headers and changed lines of unified diffs.
+
+    Added and removed lines only count inside a hunk, whose header gives its length, so
+    markdown bullets and other lines starting with a dash are not mistaken for changes.
+    """
+    diff_lines = set()
+    in_diff = False
+    old_remaining = new_remaining = 0
+    for i, line in enumerate(lines):
+        if old_remaining > 0 or new_remaining > 0:
+            marker = line[:1]
+            if marker in ("+", "-", " ", ""):
+                if marker != "+":
+                    old_remaining -= 1
+                if marker != "-":
+                    new_remaining -= 1
+                if marker in ("+", "-"):
+                    diff_lines.add(i)
+                continue
+            old_remaining = new_remaining = 0
+
+        hunk = _HUNK_HEADER.match(line)
+        if hunk:
+            in_diff = True
+            old_remaining = int(hunk.group(1) or 1)
+            new_remaining = int(hunk.group(2) or 1)
+            diff_lines.add(i)
+        elif line.startswith("diff --git ") or (
+            line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ ")
+        ):
+            in_diff = True
+            diff_lines.add(i)
+        elif in_diff and _DIFF_HEADER.match(line):
+            diff_lines.add(i)
+        else:
+            in_diff = False
+    return diff_lines
+
+
+def _important_lines(lines: list[str]) -> set[int]:
+    important = _diff_lines(lines)
+    in_traceback = False
+    for i, line in enumerate(lines):
+        if line.startswith("Traceback (most recent call last)"):
+            in_traceback = True
+        if in_traceback or _EDIT_BLOCK_MARKER.match(line) or _ERROR_LINE.search(line):
+            important.add(i)
+        # A traceback ends with the first unindented line after its header.
+        if in_traceback and line and not line[0].isspace() and not line.startswith("Traceback"):
+            in_traceback = False
+    return important
+
+
+def _select_lines(lines: list[str], important: set[int], token_budget: int) -> list[str]:
+    keep = set(important)
+    used = sum(count_tokens(lines[i]) + 1 for i in keep)
+
+    # Fill the remaining budget with context, alternating between the start and the end.
+    head, tail = 0, len(lines) - 1
+    take_head = True
+    while head <= tail and used < token_budget:
+        index = head if take_head else tail
+        if take_head:
+            head += 1
+        else:
+            tail -= 1
+        take_head = not take_head
+        if index in keep:
+            continue
+
+        cost = count_tokens(lines[index]) + 1
+        if used + cost > token_budget:
+            break
+        keep.add(index)
+        used += cost
+
+    selected = []
+    omitted = 0
+    for i, line in enumerate(lines):
+        if i in keep:
+            if omitted:
+                selected.append(f"[... {omitted} lines omitted ...]")
+                omitted = 0
+            selected.append(line)
+        else:
+            omitted += 1
+    if omitted:
+        selected.append(f"[... {omitted} lines omitted ...]")
+    return selected
+
+
+def _split_by_tokens(text: str, token_budget: int) -> list[str]:
+    chunks = []
+    current: list[str] = []
+    current_tokens = 0
+    for line in text.split("\n"):
+        line_tokens = count_tokens(line) + 1
+        if current and current_tokens + line_tokens > token_budget:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _truncate(text: str, token_budget: int) -> str:
+    chunks = _split_by_tokens(text, token_budget)
+    if len(chunks) > 1:
+        omitted = sum(chunk.count("\n") + 1 for chunk in chunks[1:])
+        return f"{chunks[0]}\n[... {omitted} lines omitted ...]"
+    return text
+
+
+def _summarize_chunk(chunk: str) -> str:
+    return chat_completion(
+        WEAK_MODEL,
+        [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that processes technical logs.",
+            },
+            {
+                "role": "user",
+                "content": (
+                    "Summarize this excerpt of logs from an AI coding assistant. Keep every "
+                    "code change, file name, command and error, and drop everything else.\n\n"
+                    f"{chunk}"
+                ),
+            },
+        ],
+    )
+
+
+def _summarize_hierarchically(text: str, token_budget: int) -> str:
+    while count_tokens(text) > token_budget:
+        chunks = _split_by_tokens(text, token_budget)
+        logger.info(f"Summarizing {len(chunks)} log chunks to fit {token_budget} tokens")
+        summary = "\n\n".join(_summarize_chunk(chunk) for chunk in chunks)
+        if count_tokens(summary) >= count_tokens(text):
+            logger.warning("Log summarization did not shrink the logs, truncating them")
+            return _truncate(summary, token_budget)
+        text = summary
+    return text
+
+
+def condense_logs(logs: str, token_budget: int, summarize: bool = True) -> str:
+    """Shrink logs to the token budget, keeping diffs and errors over routine output."""
+    # Diffs and errors are found before anything is dropped, since collapsing repeated
+    # lines inside a hunk would end it early.
+    lines = logs.split("\n")
+    lines, important = _collapse_lines(lines, _important_lines(lines))
+    condensed = "\n".join(lines)
+    if count_tokens(condensed) <= token_budget:
+        return condensed
+
+    condensed = "\n".join(_select_lines(lines, important, token_budget))
+    if count_tokens(condensed) <= token_budget:
+        logger.info(f"Condensed logs locally to fit {token_budget} tokens")
+        return condensed
+
+    # Diffs and errors alone exceed the budget, so only an LLM can shrink them further.
+    if summarize:
+        return _summarize_hierarchically(condensed, token_budget)
+    return _truncate(condensed, token_budget)
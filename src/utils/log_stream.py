@@ -0,0 +1,85 @@
+import codecs
+import gzip
+import re
+from collections import deque
+from pathlib import Path
+from typing import Optional, Union
+
+from loguru import logger
+
+ANSI_ESCAPE = re.compile(r"\x1B[@-_][0-?]*[ -/]*[@-~]")
+# An escape sequence that may still be completed by the next chunk.
+_PARTIAL_ANSI_ESCAPE = re.compile(r"\x1B(?:[@-_][0-?]*[ -/]*)?$")
+_STOP_MARKER = "Tokens:"
+
+
+class LogStream:
+    def __init__(self, spill_path: Optional[Union[Path, str]] = None, max_chars: int = 200_000):
+        self.max_chars = max_chars
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.total_bytes = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+        self._partial_line = ""
+        self._lines: deque[str] = deque()
+        self._retained_chars = 0
+        self._stopped = False
+        self._spill_file = None
+        if self.spill_path:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._spill_file = gzip.open(self.spill_path, "wb")
+
+    def feed(self, chunk: bytes) -> str:
+        """Consume a raw chunk and return its text with ANSI escapes removed."""
+        self.total_bytes += len(chunk)
+        if self._spill_file:
+            self._spill_file.write(chunk)
+        return self._process(self._decoder.decode(chunk))
+
+    def _process(self, text: str, final: bool = False) -> str:
+        text = self._pending + text
+        self._pending = ""
+        if not final:
+            partial = _PARTIAL_ANSI_ESCAPE.search(text)
+            if partial:
+                self._pending = text[partial.start() :]
+                text = text[: partial.start()]
+
+        text = ANSI_ESCAPE.sub("", text)
+        self._retain(text)
+        return text
+
+    def _retain(self, text: str) -> None:
+        # Only the output before the first token report is relevant to the summary.
+        if self._stopped or not text:
+            return
+
+        # The marker can straddle chunks, but never a line break.
+        text = self._partial_line + text
+        if _STOP_MARKER in text:
+            text = text.split(_STOP_MARKER)[0]
+            self._stopped = True
+
+        *complete_lines, self._partial_line = text.split("\n")
+        for line in complete_lines:
+            self._lines.append(line)
+            self._retained_chars += len(line) + 1
+        self._partial_line = self._partial_line[-self.max_chars :]
+
+        while self._lines and self._retained_chars + len(self._partial_line) > self.max_chars:
+            self._retained_chars -= len(self._lines.popleft()) + 1
+
+    def close(self) -> None:
+        """Flush buffered input and close the spill file."""
+        self._process(self._decoder.decode(b"", final=True), final=True)
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
+            logger.info(f"Saved {self.total_bytes} bytes of logs to {self.spill_path}")
+
+    def text(self) -> str:
+        """Return the retained tail of the processed log."""
+        lines = list(self._lines)
+        if self._partial_line:
+            lines.append(self._partial_line)
+        return "\n".join(lines).replace("Provider List:", "")
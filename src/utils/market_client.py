@@ -0,0 +1,144 @@
+import asyncio
+import atexit
+import os
+import re
+import time
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+from src import metrics
+from src.config import SETTINGS, Settings
+from src.utils.market_traffic import (
+    AsyncRecordingTransport,
+    RecordingTransport,
+    ReplayTransport,
+    get_traffic_recorder,
+    get_traffic_replay,
+)
+
+TIMEOUT = httpx.Timeout(10.0)
+_API_VERSION = re.compile(r"v\d+")
+
+_sync_client: Optional[httpx.Client] = None
+_sync_client_pid: Optional[int] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _endpoint(path: str) -> str:
+    """Replace the IDs in a path, so requests are counted per endpoint."""
+    segments = [
+        "{id}"
+        if any(c.isdigit() for c in segment) and not _API_VERSION.fullmatch(segment)
+        else segment
+        for segment in path.split("/")
+    ]
+    return "/".join(segments)
+
+
+def _start_timer(request: httpx.Request) -> None:
+    request.extensions["metrics_started_at"] = time.perf_counter()
+
+
+def _observe_response(response: httpx.Response) -> None:
+    # Called once the headers arrived, so streamed lists are timed to their first byte.
+    request = response.request
+    metrics.observe(
+        "market_request_duration_seconds",
+        time.perf_counter() - request.extensions["metrics_started_at"],
+        method=request.method,
+        endpoint=_endpoint(request.url.path),
+        status=response.status_code,
+    )
+
+
+async def _async_start_timer(request: httpx.Request) -> None:
+    _start_timer(request)
+
+
+async def _async_observe_response(response: httpx.Response) -> None:
+    _observe_response(response)
+
+
+def _traffic_transport(settings: Settings, limits: httpx.Limits, asynchronous: bool):
+    """Build the transport that replays or records market traffic, if either is enabled."""
+    if settings.market_replay_dir:
+        replay = get_traffic_replay(settings.market_replay_dir, settings.market_replay_speed)
+        return ReplayTransport(replay)
+
+    if settings.market_record_dir:
+        recorder = get_traffic_recorder(settings.market_record_dir)
+        if asynchronous:
+            transport = httpx.AsyncHTTPTransport(http2=settings.market_http2, limits=limits)
+            return AsyncRecordingTransport(transport, recorder)
+        transport = httpx.HTTPTransport(http2=settings.market_http2, limits=limits)
+        return RecordingTransport(transport, recorder)
+    return None
+
+
+def _client_options(settings: Settings, asynchronous: bool = False) -> dict:
+    limits = httpx.Limits(
+        max_connections=settings.market_max_connections,
+        max_keepalive_connections=settings.market_max_keepalive_connections,
+        keepalive_expiry=settings.market_keepalive_expiry,
+    )
+    return {
+        "base_url": settings.market_url,
+        "headers": {
+            "x-api-key": settings.market_api_key,
+            "Accept": "application/json",
+        },
+        "limits": limits,
+        "http2": settings.market_http2,
+        "timeout": TIMEOUT,
+        "transport": _traffic_transport(settings, limits, asynchronous),
+        "event_hooks": (
+            {"request": [_async_start_timer], "response": [_async_observe_response]}
+            if asynchronous
+            else {"request": [_start_timer], "response": [_observe_response]}
+        ),
+    }
+
+
+def get_market_client(settings: Settings = SETTINGS) -> httpx.Client:
+    global _sync_client, _sync_client_pid
+    # A pool inherited through fork shares sockets with the parent, so each process
+    # builds its own client instead of reusing the parent's.
+    if _sync_client is None or _sync_client_pid != os.getpid():
+        _sync_client = httpx.Client(**_client_options(settings))
+        _sync_client_pid = os.getpid()
+        logger.debug(f"Created market HTTP client for process {_sync_client_pid}")
+    return _sync_client
+
+
+def get_async_market_client(settings: Settings = SETTINGS) -> httpx.AsyncClient:
+    global _async_client, _async_client_loop
+    # Async connections are bound to the event loop that opened them.
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(**_client_options(settings, asynchronous=True))
+        _async_client_loop = loop
+        logger.debug("Created async market HTTP client")
+    return _async_client
+
+
+def close_market_clients() -> None:
+    global _sync_client, _async_client, _async_client_loop
+    if _sync_client is not None and _sync_client_pid == os.getpid():
+        _sync_client.close()
+    _sync_client = None
+
+    if (
+        _async_client is not None
+        and _async_client_loop is not None
+        and not _async_client_loop.is_closed()
+        and not _async_client_loop.is_running()
+    ):
+        _async_client_loop.run_until_complete(_async_client.aclose())
+    _async_client = None
+    _async_client_loop = None
+
+
+atexit.register(close_market_clients)
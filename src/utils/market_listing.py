@@ -0,0 +1,162 @@
+import asyncio
+import codecs
+import json
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+from loguru import logger
+
+from src.config import SETTINGS, Settings
+from src.utils.instance_index import SeenInstanceIndex
+
+_WHITESPACE = " \t\n\r"
+
+
+class JsonArrayParser:
+    """Incrementally parse the items of a top-level JSON array from raw chunks."""
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self._expect_item = True
+        self.finished = False
+
+    def _skip_whitespace(self, position: int) -> int:
+        while position < len(self._buffer) and self._buffer[position] in _WHITESPACE:
+            position += 1
+        return position
+
+    def feed(self, chunk: bytes) -> list:
+        """Consume a chunk and return the items it completed."""
+        self._buffer += self._text_decoder.decode(chunk)
+        items = []
+        position = self._skip_whitespace(0)
+
+        if not self._started and position < len(self._buffer):
+            if self._buffer[position] != "[":
+                raise ValueError(f"Expected a JSON array, got: {self._buffer[position:][:100]}")
+            self._started = True
+            position = self._skip_whitespace(position + 1)
+
+        while self._started and not self.finished and position < len(self._buffer):
+            character = self._buffer[position]
+            if character == "]":
+                self.finished = True
+                position += 1
+                break
+            if not self._expect_item:
+                if character != ",":
+                    raise ValueError(f"Unexpected character {character!r} in JSON array")
+                self._expect_item = True
+                position = self._skip_whitespace(position + 1)
+                continue
+
+            try:
+                item, end = self._decoder.raw_decode(self._buffer, position)
+            except json.JSONDecodeError:
+                break  # The item is not complete yet.
+            # A number cut by the chunk boundary ("1." of "1.5") decodes as a shorter one,
+            # so an item only counts once the separator after it has arrived.
+            separator = self._skip_whitespace(end)
+            if separator >= len(self._buffer) or self._buffer[separator] not in ",]":
+                break
+            items.append(item)
+            self._expect_item = False
+            position = self._skip_whitespace(end)
+
+        self._buffer = self._buffer[position:]
+        return items
+
+    def close(self) -> None:
+        if not self.finished:
+            raise ValueError("Truncated JSON array")
+
+
+class MarketListReader:
+    """Iterate over a market list endpoint without holding the whole list in memory.
+
+    Without a page size the response is streamed and parsed as it arrives. With one,
+    pages are requested with `offset` and `limit`, several at a time. Iteration stops
+    early, without fetching anything else, once `stop` returns True for an item.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        params: Optional[dict] = None,
+        settings: Settings = SETTINGS,
+        index: Optional[SeenInstanceIndex] = None,
+        stop: Optional[Callable[[dict], bool]] = None,
+    ):
+        self.client = client
+        self.url = url
+        self.params = params or {}
+        self.page_size = settings.market_page_size
+        self.page_concurrency = settings.market_page_concurrency
+        # A 304 page does not say whether more pages follow, so only whole listings
+        # are fetched conditionally.
+        self.index = index if not self.page_size else None
+        self.stop = stop
+        # The streamed response, whose validators apply to the whole listing.
+        self.response: Optional[httpx.Response] = None
+        self.not_modified = False
+
+    def __aiter__(self) -> AsyncIterator[dict]:
+        if self.page_size:
+            return self._iter_pages()
+        return self._iter_stream()
+
+    async def _iter_stream(self) -> AsyncIterator[dict]:
+        headers = {}
+        if self.index is not None:
+            request_url = str(self.client.build_request("GET", self.url, params=self.params).url)
+            headers = self.index.conditional_headers(request_url)
+
+        async with self.client.stream(
+            "GET", self.url, params=self.params, headers=headers
+        ) as response:
+            if response.status_code == httpx.codes.NOT_MODIFIED:
+                self.not_modified = True
+                return
+            response.raise_for_status()
+
+            parser = JsonArrayParser()
+            async for chunk in response.aiter_bytes():
+                for item in parser.feed(chunk):
+                    if self.stop and self.stop(item):
+                        logger.debug(f"Stopped reading {self.url} early")
+                        return
+                    yield item
+            parser.close()
+            self.response = response
+
+    async def _fetch_page(self, page: int) -> list[dict]:
+        params = {**self.params, "offset": page * self.page_size, "limit": self.page_size}
+        response = await self.client.get(self.url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _iter_pages(self) -> AsyncIterator[dict]:
+        page = 0
+        while True:
+            pages = range(page, page + self.page_concurrency)
+            tasks = [asyncio.create_task(self._fetch_page(number)) for number in pages]
+            try:
+                for task in tasks:
+                    items = await task
+                    for item in items:
+                        if self.stop and self.stop(item):
+                            logger.debug(f"Stopped reading {self.url} early at page {page}")
+                            return
+                        yield item
+                    page += 1
+                    if len(items) < self.page_size:
+                        return
+            finally:
+                for task in tasks:
+                    task.cancel()
+                # Retrieve the outcome of pages that are no longer needed.
+                await asyncio.gather(*tasks, return_exceptions=True)
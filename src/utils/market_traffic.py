@@ -0,0 +1,265 @@
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+# Request headers are not recorded (they carry the API key), except the validators that
+# decide whether the market answers 304.
+_CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+_RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+_TIMESTAMP = re.compile(
+    r'"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?)(Z|[+-]\d{2}:\d{2})?"'
+)
+
+
+def _request_key(request: httpx.Request) -> tuple:
+    return (
+        request.method,
+        request.url.raw_path.decode(),
+        request.content.decode("utf-8", "replace"),
+    )
+
+
+def _conditions(request: httpx.Request) -> dict:
+    return {name: request.headers[name] for name in _CONDITIONAL_HEADERS if name in request.headers}
+
+
+class TrafficRecorder:
+    """Append market exchanges to a gzipped JSON lines file, storing each distinct body once."""
+
+    def __init__(self, directory: str):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = Path(directory) / f"market-{os.getpid()}-{time.time_ns()}.jsonl.gz"
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self._bodies: set[str] = set()
+        self._lock = threading.Lock()
+        logger.info(f"Recording market traffic to {self.path}")
+
+    def record(
+        self, request: httpx.Request, response: httpx.Response, body: bytes, elapsed: float
+    ) -> None:
+        body_id = hashlib.sha256(body).hexdigest()[:20]
+        method, path, request_body = _request_key(request)
+        entry = {
+            "at": time.time(),
+            "method": method,
+            "path": path,
+            "request_body": request_body,
+            "conditions": _conditions(request),
+            "status": response.status_code,
+            "headers": {
+                name: response.headers[name]
+                for name in _RECORDED_HEADERS
+                if name in response.headers
+            },
+            "elapsed": round(elapsed, 6),
+            "body_id": body_id,
+        }
+        with self._lock:
+            # Unchanged listings are polled over and over, so only their first copy is kept.
+            if body_id not in self._bodies:
+                entry["body"] = body.decode("utf-8", "replace")
+                self._bodies.add(body_id)
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            # Flushed per exchange: solver workers exit without closing the file.
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _decoded_response(response: httpx.Response, raw: bytes) -> tuple[httpx.Response, bytes]:
+    """Rebuild a consumed transport response, and return it with its decoded body."""
+    rebuilt = httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        content=raw,
+        extensions=response.extensions,
+    )
+    return rebuilt, rebuilt.content
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, recorder: TrafficRecorder):
+        self._transport = transport
+        self._recorder = recorder
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started_at = time.perf_counter()
+        response = self._transport.handle_request(request)
+        try:
+            raw = b"".join(response.iter_raw())
+        finally:
+            response.close()
+        response, body = _decoded_response(response, raw)
+        self._recorder.record(request, response, body, time.perf_counter() - started_at)
+        return response
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, recorder: TrafficRecorder):
+        self._transport = transport
+        self._recorder = recorder
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started_at = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        try:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await response.aclose()
+        response, body = _decoded_response(response, raw)
+        self._recorder.record(request, response, body, time.perf_counter() - started_at)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _read_entries(path: Path) -> list[dict]:
+    entries = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entries.append(json.loads(line))
+    except (EOFError, zlib.error, json.JSONDecodeError):
+        # Files of processes that did not close them end without a gzip trailer.
+        logger.debug(f"Recording {path} is truncated after {len(entries)} exchanges")
+    return entries
+
+
+class TrafficReplay:
+    """Serve recorded market responses in the order they were recorded.
+
+    Each request gets the next response recorded for the same method, path, body and
+    validators, and the last one again once they run out. Timestamps in the bodies are
+    moved forward by the time since the recording started, so recorded data is as recent
+    to the handlers as it was when it was captured. With a speed, each response is delayed
+    by its recorded latency divided by the speed.
+    """
+
+    def __init__(self, directory: str, speed: Optional[float] = None):
+        entries = []
+        for path in sorted(Path(directory).glob("*.jsonl.gz")):
+            entries.extend(_read_entries(path))
+        if not entries:
+            raise ValueError(f"No recorded market traffic found in {directory}")
+        entries.sort(key=lambda entry: entry["at"])
+
+        self.speed = speed
+        self._bodies = {entry["body_id"]: entry["body"] for entry in entries if "body" in entry}
+        self._exchanges: dict[tuple, list[dict]] = defaultdict(list)
+        self._fallbacks: dict[tuple, list[dict]] = defaultdict(list)
+        for entry in entries:
+            key = (entry["method"], entry["path"], entry["request_body"])
+            conditions = json.dumps(entry["conditions"], sort_keys=True)
+            self._exchanges[(*key, conditions)].append(entry)
+            if entry["status"] != httpx.codes.NOT_MODIFIED:
+                self._fallbacks[key].append(entry)
+        self._positions: dict[tuple, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._shift = timedelta(seconds=time.time() - entries[0]["at"])
+        logger.info(f"Replaying {len(entries)} market exchanges from {directory}")
+
+    def _shift_timestamp(self, match: re.Match) -> str:
+        shifted = datetime.fromisoformat(match.group(1)) + self._shift
+        timespec = "microseconds" if "." in match.group(1) else "seconds"
+        return f'"{shifted.isoformat(timespec=timespec)}{match.group(2) or ""}"'
+
+    def _next_entry(self, request: httpx.Request) -> Optional[dict]:
+        key = _request_key(request)
+        exact_key = (*key, json.dumps(_conditions(request), sort_keys=True))
+        # Requests whose validators were never recorded, such as the first request of a
+        # process that starts mid-recording, get a full response instead.
+        lookup_key, exchanges = exact_key, self._exchanges.get(exact_key)
+        if not exchanges:
+            lookup_key, exchanges = key, self._fallbacks.get(key)
+        if not exchanges:
+            return None
+        with self._lock:
+            position = self._positions[lookup_key]
+            self._positions[lookup_key] = position + 1
+        return exchanges[min(position, len(exchanges) - 1)]
+
+    def respond(self, request: httpx.Request) -> tuple[httpx.Response, float]:
+        """Return the replayed response to a request and how long to delay it."""
+        entry = self._next_entry(request)
+        if entry is None:
+            logger.warning(f"No recorded response for {request.method} {request.url}")
+            response = httpx.Response(
+                httpx.codes.NOT_FOUND, json={"detail": "Not recorded"}, request=request
+            )
+            return response, 0.0
+
+        body = _TIMESTAMP.sub(self._shift_timestamp, self._bodies.get(entry["body_id"], ""))
+        response = httpx.Response(
+            entry["status"], headers=entry["headers"], content=body.encode(), request=request
+        )
+        delay = entry["elapsed"] / self.speed if self.speed else 0.0
+        return response, delay
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(self, replay: TrafficReplay):
+        self._replay = replay
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response, delay = self._replay.respond(request)
+        if delay:
+            time.sleep(delay)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response, delay = self._replay.respond(request)
+        if delay:
+            await asyncio.sleep(delay)
+        return response
+
+
+_recorder: Optional[TrafficRecorder] = None
+_recorder_pid: Optional[int] = None
+_replay: Optional[TrafficReplay] = None
+
+
+def get_traffic_recorder(directory: str) -> TrafficRecorder:
+    global _recorder, _recorder_pid
+    # A file inherited through fork would be written by two processes, so each process
+    # records to its own.
+    if _recorder is None or _recorder_pid != os.getpid():
+        _recorder = TrafficRecorder(directory)
+        _recorder_pid = os.getpid()
+    return _recorder
+
+
+def close_traffic_recorder() -> None:
+    global _recorder
+    if _recorder is not None and _recorder_pid == os.getpid():
+        _recorder.close()
+    _recorder = None
+
+
+def get_traffic_replay(directory: str, speed: Optional[float] = None) -> TrafficReplay:
+    global _replay
+    if _replay is None:
+        _replay = TrafficReplay(directory, speed)
+    return _replay
+
+
+atexit.register(close_traffic_recorder)
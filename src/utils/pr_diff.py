@@ -0,0 +1,176 @@
+import json
+import re
+from dataclasses import asdict
+from typing import Optional
+
+import git
+from loguru import logger
+
+from src.agents.prompt_cache import PromptCache
+from src.config import SETTINGS
+from src.utils.git import fetch_mirror_refs, get_mirror_path, update_repository_mirror
+from src.utils.github_client import PrFile, split_diff_by_file
+
+_STATUSES = {
+    "A": "added",
+    "D": "removed",
+    "M": "modified",
+    "R": "renamed",
+    "C": "copied",
+    "T": "changed",
+}
+_VENDORED_PATH = re.compile(
+    r"(^|/)(vendor|vendored|third_party|node_modules|dist|build|\.yarn)/|"
+    r"\.min\.(js|css)$|\.(map|lock)$|"
+    r"(^|/)(package-lock\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|Cargo\.lock|go\.sum)$"
+)
+
+_diff_cache: Optional[PromptCache] = None
+
+
+def _get_diff_cache() -> PromptCache:
+    global _diff_cache
+    if _diff_cache is None:
+        _diff_cache = PromptCache(cache_dir=SETTINGS.pr_diff_cache_dir, max_entries=1000)
+    return _diff_cache
+
+
+def is_vendored(path: str) -> bool:
+    return bool(_VENDORED_PATH.search(path))
+
+
+def _has_commit(repo: git.Repo, sha: str) -> bool:
+    try:
+        repo.git.cat_file("-e", f"{sha}^{{commit}}")
+        return True
+    except git.GitCommandError:
+        return False
+
+
+def _parse_name_status(output: str) -> list[tuple[str, str]]:
+    """Parse `git diff --name-status -z` output into (status, new path) pairs."""
+    fields = output.split("\0")
+    entries = []
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i]
+        if status[0] in "RC":
+            entries.append((_STATUSES[status[0]], fields[i + 2]))
+            i += 3
+        else:
+            entries.append((_STATUSES.get(status[0], "changed"), fields[i + 1]))
+            i += 2
+    return entries
+
+
+def _parse_numstat(output: str) -> dict[str, tuple[Optional[int], Optional[int]]]:
+    """Parse `git diff --numstat -z` output, with None counts for binary files."""
+    fields = output.split("\0")
+    stats = {}
+    i = 0
+    while i < len(fields) - 1:
+        additions, deletions, path = fields[i].split("\t", 2)
+        if not path:
+            # Renames and copies list the old and the new path as separate fields.
+            path = fields[i + 2]
+            i += 3
+        else:
+            i += 1
+        stats[path] = (
+            int(additions) if additions != "-" else None,
+            int(deletions) if deletions != "-" else None,
+        )
+    return stats
+
+
+def _compute_pr_diff(
+    repo: git.Repo, base_sha: str, head_sha: str, max_file_chars: int, max_total_chars: int
+) -> list[PrFile]:
+    revision_range = f"{base_sha}...{head_sha}"
+    name_status = _parse_name_status(repo.git.diff("--name-status", "-z", "-M", revision_range))
+    numstat = _parse_numstat(repo.git.diff("--numstat", "-z", "-M", revision_range))
+
+    files = []
+    diffable_paths = set()
+    for status, path in name_status:
+        additions, deletions = numstat.get(path, (None, None))
+        file = PrFile(
+            filename=path, status=status, additions=additions or 0, deletions=deletions or 0
+        )
+        if additions is None:
+            file.patch = "Binary file, patch skipped"
+        elif is_vendored(path):
+            file.patch = "Vendored or generated file, patch skipped"
+        else:
+            diffable_paths.add(path)
+        files.append(file)
+
+    patches = {}
+    if diffable_paths:
+        # Renames only pair up if both sides are in the pathspec, so exclude instead.
+        skipped = [f":(exclude,literal){file.filename}" for file in files if file.patch]
+        diff = repo.git.diff(
+            "-M", "--no-color", "--no-ext-diff", revision_range, "--", ".", *skipped
+        )
+        # Undecodable bytes come back as surrogates, which cannot be stored as UTF-8.
+        diff = diff.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+        patches = split_diff_by_file(diff)
+
+    # Smaller patches are kept first, so one huge file cannot crowd out all the others.
+    diffable_files = [file for file in files if file.filename in diffable_paths]
+    diffable_files.sort(key=lambda file: len(patches.get(file.filename) or ""))
+    total_chars = 0
+    for file in diffable_files:
+        patch = patches.get(file.filename)
+        if patch is None:
+            continue
+        if len(patch) > max_file_chars:
+            omitted_lines = patch[max_file_chars:].count("\n") + 1
+            patch = f"{patch[:max_file_chars]}\n[... {omitted_lines} more lines truncated ...]"
+        if total_chars + len(patch) > max_total_chars:
+            file.patch = "Patch omitted, the total diff size limit was reached"
+            continue
+        file.patch = patch
+        total_chars += len(patch)
+
+    return files
+
+
+def compute_pr_diff(
+    repo_url: str,
+    base_sha: str,
+    head_sha: str,
+    max_file_chars: Optional[int] = None,
+    max_total_chars: Optional[int] = None,
+    pr_number: Optional[int] = None,
+) -> list[PrFile]:
+    """Compute the files and patches of a PR (base...head) from the local mirror."""
+    max_file_chars = max_file_chars or SETTINGS.pr_diff_max_file_chars
+    max_total_chars = max_total_chars or SETTINGS.pr_diff_max_total_chars
+
+    def has_commits(repo: git.Repo) -> bool:
+        return _has_commit(repo, base_sha) and _has_commit(repo, head_sha)
+
+    def compute() -> str:
+        mirror_path = get_mirror_path(repo_url)
+        if not (mirror_path / "HEAD").exists():
+            update_repository_mirror(repo_url)
+        repo = git.Repo(mirror_path)
+        if not has_commits(repo) and pr_number is not None:
+            # The mirror tracks branches and tags only. The head of a PR from a fork is
+            # only reachable from the PR's own ref.
+            ref = f"refs/pull/{pr_number}/head"
+            fetch_mirror_refs(repo_url, f"+{ref}:{ref}")
+        if not has_commits(repo):
+            update_repository_mirror(repo_url)
+        if not has_commits(repo):
+            raise ValueError(f"Commits {base_sha}...{head_sha} are not in the mirror")
+
+        files = _compute_pr_diff(repo, base_sha, head_sha, max_file_chars, max_total_chars)
+        logger.info(f"Computed local diff of {base_sha[:12]}...{head_sha[:12]}: {len(files)} files")
+        return json.dumps([asdict(file) for file in files])
+
+    # Commits are immutable, so the diff of a revision range never has to be invalidated.
+    cache_key = f"{base_sha}...{head_sha}:{max_file_chars}:{max_total_chars}"
+    payload = _get_diff_cache().get_or_compute(cache_key, "pr-diff", compute)
+    return [PrFile(**file) for file in json.loads(payload)]
@@ -0,0 +1,39 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional, Union
+
+
+def is_process_alive(pid: Optional[int]) -> bool:
+    """Check if a process of this host still runs, treating a missing pid as gone."""
+    if pid is None or pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ProcessLocalDatabase:
+    """A SQLite database opened once per process, since connections do not survive fork."""
+
+    def __init__(self, db_path: Union[Path, str], schema: str):
+        self.db_path = Path(db_path)
+        self.schema = schema
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(
+                self.db_path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.schema)
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
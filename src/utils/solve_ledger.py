@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from src.config import SETTINGS
+from src.enums import SolveStatus
+from src.utils.process_utils import ProcessLocalDatabase, is_process_alive
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solves (
+    instance_id TEXT NOT NULL,
+    state_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    owner_pid INTEGER,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (instance_id, state_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_solves_updated_at ON solves (updated_at);
+"""
+
+_FINAL_STATUSES = (SolveStatus.delivered.value, SolveStatus.no_response.value)
+
+
+def conversation_state_hash(last_message: dict) -> str:
+    """Identify a conversation state by its last message."""
+    serialized = json.dumps(
+        {key: last_message.get(key) for key in ("timestamp", "sender", "message")},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+@dataclass
+class LedgerClaim:
+    instance_id: str
+    state_hash: str
+    result: Optional[str] = None
+
+
+class SolveLedger:
+    def __init__(self, db_path: str, claim_timeout: float = 3600):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.claim_timeout = claim_timeout
+        self._database = ProcessLocalDatabase(self.db_path, _SCHEMA)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._database.connect()
+
+    def is_done(self, instance_id: str, state_hash: str) -> bool:
+        """Check if a conversation state was already answered or needed no answer."""
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT status FROM solves WHERE instance_id = ? AND state_hash = ?",
+                    (instance_id, state_hash),
+                )
+                .fetchone()
+            )
+        return row is not None and row[0] in _FINAL_STATUSES
+
+    def claim(self, instance_id: str, state_hash: str) -> Optional[LedgerClaim]:
+        """Atomically claim a conversation state, or return None if it is done or claimed."""
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            # An immediate transaction takes the write lock before reading, so two
+            # processes can never both see the state as unclaimed.
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT status, result, owner_pid, claimed_at FROM solves "
+                    "WHERE instance_id = ? AND state_hash = ?",
+                    (instance_id, state_hash),
+                ).fetchone()
+                if row is not None:
+                    status, result, owner_pid, claimed_at = row
+                    if status in _FINAL_STATUSES:
+                        connection.execute("COMMIT")
+                        return None
+                    if (
+                        status == SolveStatus.claimed.value
+                        and is_process_alive(owner_pid)
+                        and now - claimed_at < self.claim_timeout
+                    ):
+                        connection.execute("COMMIT")
+                        return None
+                else:
+                    result = None
+
+                connection.execute(
+                    "INSERT INTO solves "
+                    "(instance_id, state_hash, status, result, owner_pid, claimed_at, attempts, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, 1, ?) "
+                    "ON CONFLICT (instance_id, state_hash) DO UPDATE SET status = excluded.status, "
+                    "owner_pid = excluded.owner_pid, claimed_at = excluded.claimed_at, "
+                    "attempts = attempts + 1, updated_at = excluded.updated_at",
+                    (
+                        instance_id,
+                        state_hash,
+                        SolveStatus.claimed.value,
+                        result,
+                        os.getpid(),
+                        now,
+                        now,
+                    ),
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+        return LedgerClaim(instance_id=instance_id, state_hash=state_hash, result=result)
+
+    def _update(self, claim: LedgerClaim, status: SolveStatus, result: Optional[str]) -> None:
+        with self._lock:
+            self._connect().execute(
+                "UPDATE solves SET status = ?, result = ?, owner_pid = NULL, claimed_at = NULL, "
+                "updated_at = ? WHERE instance_id = ? AND state_hash = ?",
+                (status.value, result, time.time(), claim.instance_id, claim.state_hash),
+            )
+
+    def record_result(self, claim: LedgerClaim, result: str) -> None:
+        """Store a computed result before delivery, so it is never computed again."""
+        claim.result = result
+        with self._lock:
+            self._connect().execute(
+                "UPDATE solves SET result = ?, updated_at = ? "
+                "WHERE instance_id = ? AND state_hash = ?",
+                (result, time.time(), claim.instance_id, claim.state_hash),
+            )
+
+    def mark_delivered(self, claim: LedgerClaim) -> None:
+        self._update(claim, SolveStatus.delivered, claim.result)
+
+    def mark_no_response(self, claim: LedgerClaim) -> None:
+        self._update(claim, SolveStatus.no_response, None)
+
+    def release(self, claim: LedgerClaim) -> None:
+        """Give up a claim, keeping any computed result for the next attempt."""
+        status = SolveStatus.solved if claim.result else SolveStatus.pending
+        self._update(claim, status, claim.result)
+
+    def prune(self, max_age_days: float = 30) -> None:
+        """Remove conversation states not touched for a while."""
+        with self._lock:
+            cursor = self._connect().execute(
+                "DELETE FROM solves WHERE updated_at < ?", (time.time() - max_age_days * 86400,)
+            )
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} old solve ledger entries")
+
+
+_solve_ledger: Optional[SolveLedger] = None
+
+
+def get_solve_ledger() -> SolveLedger:
+    global _solve_ledger
+    if _solve_ledger is None:
+        _solve_ledger = SolveLedger(SETTINGS.solve_ledger_path)
+    return _solve_ledger
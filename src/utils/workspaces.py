@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+import git
+from loguru import logger
+
+from src.config import SETTINGS
+from src.utils.file_utils import file_lock
+from src.utils.git import update_repository_mirror
+
+
+def _directory_size(path: Path) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                continue
+    return total
+
+
+class WorktreeManager:
+    def __init__(self, root: str, quota_bytes: int):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.root / "index.json"
+        self._index_lock_path = self.root / "index.lock"
+
+    def _worktree_path(self, mirror_path: str, branch: Optional[str]) -> Path:
+        key = hashlib.sha256(f"{mirror_path}:{branch or 'HEAD'}".encode()).hexdigest()[:12]
+        return self.root / f"{Path(mirror_path).stem}-{key}"
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Error reading workspace index {self._index_path}: {e}")
+            return {}
+
+    def _write_index(self, index: dict) -> None:
+        tmp_path = self._index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _prepare(self, mirror_path: str, worktree_path: Path, branch: Optional[str]) -> None:
+        mirror = git.Repo(mirror_path)
+        commit = mirror.commit(branch or "HEAD").hexsha
+
+        if (worktree_path / ".git").exists():
+            worktree = git.Repo(worktree_path)
+            worktree.git.checkout("--force", "--detach", commit)
+            worktree.git.clean("-ffdx")
+            logger.info(f"Reset worktree {worktree_path} to {branch or 'HEAD'} ({commit[:8]})")
+            return
+
+        if worktree_path.exists():
+            shutil.rmtree(worktree_path)
+        with file_lock(f"{mirror_path}.lock"):
+            mirror.git.worktree("prune")
+            mirror.git.worktree("add", "--force", "--detach", str(worktree_path), commit)
+        logger.info(f"Created worktree {worktree_path} at {branch or 'HEAD'} ({commit[:8]})")
+
+    @staticmethod
+    def _remove_worktree(mirror_path: str, worktree_path: Path) -> None:
+        try:
+            git.Repo(mirror_path).git.worktree("remove", "--force", str(worktree_path))
+        except Exception as e:
+            logger.warning(f"Failed to remove worktree {worktree_path} via git: {e}")
+            shutil.rmtree(worktree_path, ignore_errors=True)
+
+    def _evict(self, index: dict, keep: str) -> None:
+        total = sum(entry["size"] for entry in index.values())
+        for name, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.quota_bytes:
+                break
+            if name == keep:
+                continue
+
+            worktree_path = self.root / name
+            try:
+                with file_lock(f"{worktree_path}.lock", blocking=False):
+                    with file_lock(f"{entry['mirror']}.lock"):
+                        self._remove_worktree(entry["mirror"], worktree_path)
+            except BlockingIOError:
+                logger.debug(f"Worktree {worktree_path} is in use, not evicting it")
+                continue
+            total -= entry["size"]
+            del index[name]
+            logger.info(f"Evicted least recently used worktree {worktree_path}")
+
+    @contextmanager
+    def checkout(self, repo_url: str, branch: Optional[str] = None) -> Iterator[str]:
+        """Provide a clean worktree of the repository branch for the duration of a job."""
+        mirror_path = update_repository_mirror(repo_url)
+        worktree_path = self._worktree_path(mirror_path, branch)
+
+        with file_lock(f"{worktree_path}.lock"):
+            self._prepare(mirror_path, worktree_path, branch)
+            try:
+                yield str(worktree_path)
+            finally:
+                with file_lock(self._index_lock_path):
+                    index = self._read_index()
+                    index[worktree_path.name] = {
+                        "mirror": mirror_path,
+                        "size": _directory_size(worktree_path),
+                        "last_used": time.time(),
+                    }
+                    self._evict(index, keep=worktree_path.name)
+                    self._write_index(index)
+
+
+_worktree_manager: Optional[WorktreeManager] = None
+
+
+def get_worktree_manager() -> WorktreeManager:
+    global _worktree_manager
+    if _worktree_manager is None:
+        _worktree_manager = WorktreeManager(
+            SETTINGS.workspace_root, SETTINGS.workspace_quota_mb * 1024 * 1024
+        )
+    return _worktree_manager
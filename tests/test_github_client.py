@@ -0,0 +1,131 @@
+import uuid
+
+import pytest
+
+from benchmarks.fakes import FakeGitHub, FakeServer
+from src.config import Settings
+from src.utils.github_client import PullRequestContextFetcher
+
+PR_URL = "https://github.com/example/project/pull/7"
+
+
+def _file(path: str, change_type: str = "MODIFIED") -> dict:
+    return {
+        "path": path,
+        "additions": 1,
+        "deletions": 1,
+        "changeType": change_type,
+        "patch": f"@@ -1 +1 @@\n-old {path}\n+new {path}",
+    }
+
+
+def _comment(index: int) -> dict:
+    return {"author": "requester", "createdAt": f"2024-01-01T00:00:0{index}Z", "body": f"c{index}"}
+
+
+@pytest.fixture
+def github():
+    fake = FakeGitHub(page_size=2)
+    fake.add_pull(
+        "example",
+        "project",
+        7,
+        files=[_file("a.py", "ADDED"), _file("b.py", "DELETED"), _file("c.py")],
+        comments=[_comment(i) for i in range(3)],
+        review_threads=[[{**_comment(i), "path": "a.py", "line": i}] for i in range(3, 6)],
+    )
+    with FakeServer(fake.route) as server:
+        fake.url = server.url
+        yield fake
+
+
+@pytest.fixture
+def fetcher(github, tmp_path):
+    settings = Settings(
+        openai_api_key="test",
+        github_pat="test",
+        github_username="test",
+        github_email="test",
+        market_api_key="test",
+        agent_type="aider",
+        github_api_url=github.url,
+        github_cache_dir=str(tmp_path),
+    )
+    # Clients are shared per token, so each test gets its own.
+    return PullRequestContextFetcher(uuid.uuid4().hex, settings)
+
+
+def _graphql_variables(github: FakeGitHub) -> list[dict]:
+    return [body["variables"] for method, path, body in github.requests if path == "/graphql"]
+
+
+def _diff_requests(github: FakeGitHub) -> list[str]:
+    return [path for method, path, body in github.requests if path.startswith("/repos/")]
+
+
+def test_fetch_follows_every_connection_to_its_last_page(github, fetcher):
+    context = fetcher.fetch(PR_URL)
+
+    assert context.viewer_login == "agentmarketbot"
+    assert [comment.body for comment in context.comments] == ["c0", "c1", "c2"]
+    assert [comment.body for comment in context.review_comments] == ["c3", "c4", "c5"]
+    assert [file.filename for file in context.files] == ["a.py", "b.py", "c.py"]
+    assert [file.status for file in context.files] == ["added", "removed", "modified"]
+    assert context.files[1].patch == "@@ -1 +1 @@\n-old b.py\n+new b.py"
+    assert len(_graphql_variables(github)) == 2
+
+
+def test_fetch_resumes_comments_after_the_cached_cursor(github, fetcher):
+    fetcher.fetch(PR_URL)
+    github.pulls[("example", "project", 7)]["comments"].append(_comment(6))
+    github.requests.clear()
+
+    context = fetcher.fetch(PR_URL)
+
+    assert [comment.body for comment in context.comments] == ["c0", "c1", "c2", "c6"]
+    variables = _graphql_variables(github)
+    assert variables[0]["commentsCursor"] == "3"
+    # The head did not move, so neither the files nor the diff are fetched again.
+    assert not any(v["withFiles"] for v in variables)
+    assert _diff_requests(github) == []
+
+
+def test_fetch_refetches_files_when_the_head_moves(github, fetcher):
+    fetcher.fetch(PR_URL)
+    pull = github.pulls[("example", "project", 7)]
+    pull["head_sha"] = "head-2"
+    pull["files"].append(_file("d.py"))
+
+    context = fetcher.fetch(PR_URL)
+
+    assert [file.filename for file in context.files] == ["a.py", "b.py", "c.py", "d.py"]
+    assert context.files[3].patch == "@@ -1 +1 @@\n-old d.py\n+new d.py"
+
+
+def test_unchanged_diff_is_revalidated_by_etag(github, fetcher):
+    fetcher.fetch(PR_URL)
+    github.pulls[("example", "project", 7)]["base_sha"] = "base-2"
+    github.requests.clear()
+
+    context = fetcher.fetch(PR_URL)
+
+    assert _diff_requests(github) == ["/repos/example/project/pulls/7"]
+    assert github.not_modified == 1
+    assert context.diff_key == context.revision_key
+    assert context.files[0].patch == "@@ -1 +1 @@\n-old a.py\n+new a.py"
+
+
+def test_oversized_diff_falls_back_to_the_files_listing(github, fetcher):
+    github.pulls[("example", "project", 7)]["diff_too_large"] = True
+
+    context = fetcher.fetch(PR_URL)
+
+    assert [file.patch for file in context.files] == [
+        f"@@ -1 +1 @@\n-old {path}\n+new {path}" for path in ("a.py", "b.py", "c.py")
+    ]
+    assert _diff_requests(github) == [
+        "/repos/example/project/pulls/7",
+        "/repos/example/project/pulls/7/files",
+        "/repos/example/project/pulls/7/files",
+    ]
+    assert context.diff_etag is None